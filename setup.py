@@ -32,6 +32,8 @@ install_requires = ['Django>=1.6, <1.9', 'django-tagging', 'httplib2',
 major_python_version, minor_python_version, _, _, _ = sys.version_info
 if major_python_version < 3 or (major_python_version == 3 and minor_python_version < 4):
     install_requires.append('pathlib')
+if major_python_version < 3:
+    install_requires.extend(['futures', 'scandir'])
 
 setup(
     name = "Sumatra",
@@ -39,6 +41,8 @@ setup(
     package_dir = {'sumatra': 'sumatra'},
     packages = ['sumatra', 'sumatra.dependency_finder', 'sumatra.datastore',
                 'sumatra.recordstore', 'sumatra.recordstore.django_store',
+                'sumatra.recordstore.django_store.migrations',
+                'sumatra.recordstore.django_store.pooled_postgresql',
                 'sumatra.versioncontrol', 'sumatra.formatting',
                 'sumatra.web', 'sumatra.web.templatetags',
                 'sumatra.publishing',
@@ -19,7 +19,7 @@ from contextlib import closing  # needed for Python 2.6
 from sumatra.core import TIMESTAMP_FORMAT, component
 
 
-from .base import DataItem
+from .base import DataItem, read_chunks
 from .filesystem import FileSystemDataStore
 
 
@@ -31,6 +31,7 @@ class ArchivedDataFile(DataItem):
         self.path = path
         archive_label = self.path.split(os.path.sep)[0]
         self.tarfile_path = os.path.join(store.archive_store, archive_label + ".tar.gz")
+        self.digest_algorithm = store.digest_algorithm
         info = self._get_info()
         self.size = info.size
         self.creation = creation or datetime.datetime.fromtimestamp(info.mtime).replace(microsecond=0)
@@ -54,6 +55,13 @@ class ArchivedDataFile(DataItem):
             return content
     content = property(fget=get_content)
 
+    def iter_content(self):
+        with closing(tarfile.open(self.tarfile_path, 'r')) as data_archive:
+            f = data_archive.extractfile(self.path)
+            for chunk in read_chunks(f):
+                yield chunk
+            f.close()
+
     @property
     def sorted_content(self):
         raise NotImplementedError
@@ -84,8 +92,7 @@ class ArchivingFileSystemDataStore(FileSystemDataStore):
         new_files = self._find_new_data_files(timestamp)
         label = timestamp.strftime(TIMESTAMP_FORMAT)
         archive_paths = self._archive(label, new_files)
-        return [ArchivedDataFile(path, self).generate_key()
-                for path in archive_paths]
+        return self.generate_keys(*archive_paths)
 
     def _archive(self, label, files, delete_originals=True):
         """
@@ -12,6 +12,90 @@ import os.path
 from ..core import component_type
 
 IGNORE_DIGEST = "0"*40
+CHUNK_SIZE = 1024 * 1024  # bytes read at a time in hashing or comparing data items
+DEFAULT_DIGEST_ALGORITHM = "sha1"
+DIGEST_ALGORITHMS = ("sha1", "sha256", "blake2b")
+
+
+def new_hash(algorithm):
+    """Return a new hash object for the digest algorithm named *algorithm*."""
+    if algorithm == "blake2b" and not hasattr(hashlib, "blake2b"):
+        from pyblake2 import blake2b  # Python < 3.6
+        return blake2b()
+    return hashlib.new(algorithm)
+
+
+def available_digest_algorithms():
+    """Return the names of the digest algorithms which can be used here."""
+    algorithms = []
+    for algorithm in DIGEST_ALGORITHMS:
+        try:
+            new_hash(algorithm)
+        except (ValueError, ImportError):
+            pass
+        else:
+            algorithms.append(algorithm)
+    return algorithms
+
+
+def format_digest(algorithm, hexdigest):
+    """
+    Return a digest tagged with the name of the algorithm, e.g.
+    "blake2b:786a02...". SHA-1 digests are not tagged, as in earlier versions
+    of Sumatra.
+    """
+    if algorithm == "sha1":
+        return hexdigest
+    return "%s:%s" % (algorithm, hexdigest)
+
+
+def digest_algorithm(digest):
+    """Return the name of the algorithm with which *digest* was calculated."""
+    return digest.rpartition(":")[0] or "sha1"
+
+
+def read_chunks(fp, length=None, chunk_size=CHUNK_SIZE):
+    """
+    Read the binary file object *fp* (up to *length* bytes, if given) in
+    chunks of at most *chunk_size* bytes. To avoid allocating memory for each
+    chunk, the chunks are generally memoryviews of a single buffer, which is
+    overwritten by the next chunk.
+    """
+    readinto = getattr(fp, "readinto", None)
+    buffer = memoryview(bytearray(chunk_size))
+    while length is None or length > 0:
+        n = chunk_size if length is None else min(chunk_size, length)
+        if readinto is None:
+            chunk = fp.read(n)
+            n = len(chunk)
+        else:
+            n = readinto(buffer[:n])
+            chunk = buffer[:n]
+        if not n:
+            break
+        if length is not None:
+            length -= n
+        yield chunk
+
+
+def equal_chunks(chunks1, chunks2):
+    """
+    Compare the contents of two sequences of byte chunks, which need not be
+    split at the same places, stopping at the first difference.
+    """
+    chunks1, chunks2 = iter(chunks1), iter(chunks2)
+    rest1 = rest2 = memoryview(b"")
+    while True:
+        if not len(rest1):
+            rest1 = memoryview(next(chunks1, b""))
+        if not len(rest2):
+            rest2 = memoryview(next(chunks2, b""))
+        if not len(rest1) or not len(rest2):
+            return len(rest1) == len(rest2)
+        n = min(len(rest1), len(rest2))
+        if rest1[:n] != rest2[:n]:
+            return False
+        rest1, rest2 = rest1[n:], rest2[n:]
 
 
 @component_type
@@ -97,21 +181,50 @@ class DataKey(object):
 class DataItem(object):
     """Base class for data item classes, that may represent files or database records."""
 
+    digest_algorithm = DEFAULT_DIGEST_ALGORITHM
+    index = None  # a FileIndex of digests, for data items which can use one
+
     def __str__(self):
         return self.path
 
     @property
     def digest(self):
-        """docstring"""
-        return hashlib.sha1(self.content).hexdigest()
+        """The hash of the content, with the data item's digest algorithm."""
+        return self.get_digest(self.digest_algorithm)
+
+    def get_digest(self, algorithm):
+        """Return the hash of the content, with the given digest algorithm."""
+        return self.calculate_digest(algorithm)
+
+    def calculate_digest(self, algorithm):
+        """
+        Calculate the hash of the content with the given digest algorithm,
+        without reading it all into memory.
+        """
+        hash = new_hash(algorithm)
+        for chunk in self.iter_content():
+            hash.update(chunk)
+        return format_digest(algorithm, hash.hexdigest())
+
+    def known_digest(self):
+        """
+        Return the digest if it is known without reading the content, e.g.
+        from an index, otherwise None.
+        """
+        return None
 
     def __eq__(self, other):
         if self.size != other.size:
             return False
-        elif self.content == other.content: # use digest here?
+        digest, other_digest = self.known_digest(), other.known_digest()
+        comparable = (digest is not None and other_digest is not None
+                      and digest_algorithm(digest) == digest_algorithm(other_digest))
+        if comparable and digest == other_digest:
+            return True
+        elif not comparable and equal_chunks(self.iter_content(), other.iter_content()):
             return True
         else:
-            return self.sorted_content == other.sorted_content
+            return equal_chunks(self.iter_sorted_content(), other.iter_sorted_content())
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -130,10 +243,25 @@ class DataItem(object):
         """
         raise NotImplementedError
 
+    def iter_content(self):
+        """
+        Return an iterator over the contents of the data item, in chunks of
+        bytes. Subclasses should override this so that the content is not all
+        read into memory at once.
+        """
+        yield self.content
+
     def sorted_content(self):
         """Return the contents of the data item, sorted by line."""
         raise NotImplementedError
 
+    def iter_sorted_content(self):
+        """
+        Return an iterator over the contents of the data item, sorted by
+        line, in chunks of bytes.
+        """
+        yield self.sorted_content
+
     def save_copy(self, path):
         """
         Save a copy of the data to a local file.
@@ -151,6 +279,7 @@ class DataItem(object):
         dir = os.path.dirname(full_path)
         if not os.path.exists(dir):
             os.makedirs(dir)
-        with open(full_path, "w") as fp:
-            fp.write(self.content)
+        with open(full_path, "wb") as fp:
+            for chunk in self.iter_content():
+                fp.write(chunk)
         return full_path
@@ -13,6 +13,7 @@ from urllib.parse import urlparse
 from contextlib import closing  # needed for Python 2.6
 
 from sumatra.core import component
+from .base import read_chunks
 from .archivingfs import ArchivingFileSystemDataStore, ArchivedDataFile, TIMESTAMP_FORMAT
 
 
@@ -38,6 +39,14 @@ class DavFsDataItem(ArchivedDataFile):
     # mandatory repeat
     content = property(fget=get_content)
 
+    def iter_content(self):
+        obj = self.store.dav_fs.open(self.tarfile_path, 'rb')
+        with closing(tarfile.open(fileobj=obj)) as data_archive:
+            f = data_archive.extractfile(self.path)
+            for chunk in read_chunks(f):
+                yield chunk
+            f.close()
+
     def _get_info(self):
         obj = self.store.dav_fs.open(self.tarfile_path, 'rb')
         with closing(tarfile.open(fileobj=obj)) as data_archive:
@@ -67,8 +76,16 @@ class DavFsDataStore(ArchivingFileSystemDataStore):
         new_files = self._find_new_data_files(timestamp)
         label = timestamp.strftime(TIMESTAMP_FORMAT)
         archive_paths = self._archive(label, new_files)
-        return [DavFsDataItem(path, self).generate_key()
-                for path in archive_paths]
+        return self.generate_keys(*archive_paths)
+
+    def generate_keys(self, *paths):
+        """
+        Given a number of "paths", return a list of keys enabling the data at
+        those paths to be retrieved from this store later. The files are
+        hashed one at a time, whatever the value of `digest_workers`, as they
+        are all read through the store's single WebDAV client.
+        """
+        return [self.data_item_class(path, self).generate_key() for path in paths]
 
     def _archive(self, label, files, delete_originals=True):
         """
@@ -8,13 +8,65 @@ Datastore based on files written to and retrieved from a local filesystem.
 from __future__ import unicode_literals
 
 import os
+import time
 import datetime
 import mimetypes
+import multiprocessing
 from subprocess import Popen
 import warnings
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir  # Python 2
 from ..core import component
-from .base import DataStore, DataItem, IGNORE_DIGEST
+from .base import (DataStore, DataItem, IGNORE_DIGEST, DEFAULT_DIGEST_ALGORITHM, read_chunks,
+                   digest_algorithm, new_hash)
+
+DISCOVERY_WORKERS = 8  # number of directories scanned concurrently in looking for new files
+try:
+    DIGEST_WORKERS = min(4, multiprocessing.cpu_count())  # default number of files hashed concurrently
+except NotImplementedError:
+    DIGEST_WORKERS = 1
+
+
+def _scan_directory(path, relative_path, timestamp, ignoredirs):
+    """
+    Return the paths, relative to the data store root, of the files in the
+    directory *path* that were modified at or after *timestamp*, and the
+    (path, relative path) of each subdirectory which should be scanned in its
+    turn. Like os.walk(), symbolic links to directories are not followed and
+    directories that cannot be read are skipped.
+    """
+    # compare modification times with the timestamp as numbers, except where
+    # they are close enough for the conversion to local time to matter
+    approximate_timestamp = time.mktime(timestamp.timetuple())
+    new_files = []
+    subdirectories = []
+    try:
+        entries = list(scandir(path))
+    except OSError:
+        return new_files, subdirectories
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            if entry.name not in ignoredirs and not entry.is_symlink():
+                subdirectories.append((entry.path, os.path.join(relative_path, entry.name)))
+        else:
+            try:
+                mtime = entry.stat().st_mtime  # no extra system call on Windows
+            except OSError:  # e.g. a broken symbolic link
+                continue
+            if mtime < approximate_timestamp - 86400:
+                continue
+            if (mtime > approximate_timestamp + 86400
+                    or datetime.datetime.fromtimestamp(mtime) >= timestamp):
+                new_files.append(os.path.join(relative_path, entry.name))
+    return new_files, subdirectories
 
 
 class DataFile(DataItem):
@@ -24,9 +76,12 @@ class DataFile(DataItem):
     def __init__(self, path, store, creation=None):
         self.path = path
         self.full_path = os.path.join(store.root, path)
+        self.index = getattr(store, "index", None)
+        self.digest_algorithm = getattr(store, "digest_algorithm", DEFAULT_DIGEST_ALGORITHM)
         if os.path.exists(self.full_path):
             stats = os.stat(self.full_path)
             self.size = stats.st_size
+            self._stats = stats
         else:
             raise IOError("File %s does not exist" % self.full_path)
             # self.size = None
@@ -35,6 +90,17 @@ class DataFile(DataItem):
         self.extension = os.path.splitext(self.full_path)
         self.mimetype, self.encoding = mimetypes.guess_type(self.full_path)
 
+    def get_digest(self, algorithm):
+        if self.index is None:
+            return self.calculate_digest(algorithm)
+        return self.index.digest(self.full_path, self._stats, algorithm,
+                                 lambda: self.calculate_digest(algorithm))
+
+    def known_digest(self):
+        if self.index is None:
+            return None
+        return self.index.get(self.full_path, self._stats, self.digest_algorithm)
+
     def get_content(self, max_length=None):
         f = open(self.full_path, 'rb')
         if max_length:
@@ -45,20 +111,32 @@ class DataFile(DataItem):
         return content
     content = property(fget=get_content)
 
-    @property
-    def sorted_content(self):
+    def iter_content(self):
+        with open(self.full_path, 'rb') as f:
+            for chunk in read_chunks(f):
+                yield chunk
+
+    def _sorted_path(self):
         sorted_path = "%s,sorted" % self.full_path
         if not os.path.exists(sorted_path):
             cmd = "sort %s > %s" % (self.full_path, sorted_path)
             job = Popen(cmd, shell=True)
             job.wait()
-        f = open(sorted_path, 'rb')
-        content = f.read()
-        f.close()
-        if len(content) != self.size:  # sort adds a \n if the file does not end with one
-            assert len(content) == self.size + 1
-            content = content[:-1]
-        return content
+        # sort adds a \n if the file does not end with one
+        assert os.path.getsize(sorted_path) in (self.size, self.size + 1)
+        return sorted_path
+
+    @property
+    def sorted_content(self):
+        content = bytearray()
+        for chunk in self.iter_sorted_content():
+            content += chunk
+        return bytes(content)
+
+    def iter_sorted_content(self):
+        with open(self._sorted_path(), 'rb') as f:
+            for chunk in read_chunks(f, length=self.size):
+                yield chunk
 
     # should probably override save_copy() from base class,
     # as a filesystem copy will be much faster
@@ -71,6 +149,9 @@ class FileSystemDataStore(DataStore):
     generally be a subdirectory of the real filesystem.
     """
     data_item_class = DataFile
+    index = None  # a FileIndex of file digests, set by the project
+    digest_workers = DIGEST_WORKERS  # may be changed per project
+    digest_algorithm = DEFAULT_DIGEST_ALGORITHM  # may be changed per project
 
     def __init__(self, root):
         self.root = os.path.abspath(root or "./Data")
@@ -84,6 +165,13 @@ class FileSystemDataStore(DataStore):
     def __setstate__(self, state):
         self.__init__(**state)
 
+    def copy(self):
+        new = DataStore.copy(self)
+        new.index = self.index
+        new.digest_workers = self.digest_workers
+        new.digest_algorithm = self.digest_algorithm
+        return new
+
     def __get_root(self):
         return self._root
 
@@ -108,26 +196,49 @@ class FileSystemDataStore(DataStore):
         # be mixed in with this one.
         # For this reason, concurrently running computations should each use
         # their own datastore, each with a different root.
+        # Directories are scanned level by level, those at the same level in
+        # parallel. Subtrees cannot be skipped on the basis of the modification
+        # time of their root directory, since this does not change when a file
+        # is modified in place, or when a file is added to a subdirectory.
         timestamp = timestamp.replace(microsecond=0)  # Round down to the nearest second
-        # Find and add new data files
-        length_dataroot = len(self.root) + len(os.path.sep)
         new_files = []
-        for root, dirs, files in os.walk(self.root):
-            for igdir in ignoredirs:
-                if igdir in dirs:
-                    dirs.remove(igdir)
-            for file in files:
-                full_path = os.path.join(root, file)
-                relative_path = os.path.join(root[length_dataroot:], file)
-                last_modified = datetime.datetime.fromtimestamp(os.stat(full_path).st_mtime)
-                if last_modified >= timestamp:
-                    new_files.append(relative_path)
-        return new_files
+        directories = [(self.root, "")]
+        executor = None
+        try:
+            while directories:
+                if len(directories) > 1 and DISCOVERY_WORKERS > 1:
+                    executor = executor or ThreadPoolExecutor(DISCOVERY_WORKERS)
+                    results = executor.map(lambda d: _scan_directory(d[0], d[1], timestamp, ignoredirs),
+                                           directories)
+                else:
+                    results = [_scan_directory(path, relative_path, timestamp, ignoredirs)
+                               for path, relative_path in directories]
+                directories = []
+                for files, subdirectories in results:
+                    new_files.extend(files)
+                    directories.extend(subdirectories)
+        finally:
+            if executor:
+                executor.shutdown()
+        return sorted(new_files)
 
     def find_new_data(self, timestamp):
         """Finds newly created/changed data items"""
-        return [DataFile(path, self).generate_key()
-                for path in self._find_new_data_files(timestamp)]
+        return self.generate_keys(*self._find_new_data_files(timestamp))
+
+    def generate_keys(self, *paths):
+        """
+        Given a number of "paths", return a list of keys enabling the data at
+        those paths to be retrieved from this store later. Up to
+        `digest_workers` files are hashed at once (hashlib releases the GIL
+        while hashing, as does reading a file). The keys are in the same
+        order as the paths.
+        """
+        generate_key = lambda path: self.data_item_class(path, self).generate_key()
+        if len(paths) > 1 and self.digest_workers > 1:
+            with ThreadPoolExecutor(min(self.digest_workers, len(paths))) as executor:
+                return list(executor.map(generate_key, paths))
+        return [generate_key(path) for path in paths]
 
     def get_data_item(self, key):
         """
@@ -137,8 +248,21 @@ class FileSystemDataStore(DataStore):
             df = self.data_item_class(key.path, self, key.creation)
         except IOError:
             raise KeyError("File %s does not exist." % key.path)
-        if key.digest != IGNORE_DIGEST and df.digest != key.digest:
-            raise KeyError("Digests do not match.")  # add info about file sizes?
+        if key.digest == IGNORE_DIGEST:
+            return df
+        # the key may have been generated with a different digest algorithm
+        # from the current one, e.g. SHA-1 before the project was changed
+        algorithm = digest_algorithm(key.digest)
+        try:
+            new_hash(algorithm)
+        except (ValueError, ImportError):  # e.g. a key from a newer version of Sumatra
+            raise KeyError("Cannot check file %s: unsupported digest algorithm '%s'." % (key.path, algorithm))
+        if df.get_digest(algorithm) != key.digest:
+            # don't rely on the index to reject a file, in case the file has
+            # been changed without changing its size or timestamps
+            if df.index is None or df.calculate_digest(algorithm) != key.digest:
+                raise KeyError("Digests do not match.")  # add info about file sizes?
+            df.index.discard(df.full_path)
         return df
 
     def delete(self, *keys):
@@ -155,3 +279,17 @@ class FileSystemDataStore(DataStore):
 
     def contains_path(self, path):
         return os.path.isfile(os.path.join(self.root, path))
+
+    def update_index(self):
+        """
+        Add the digests of all files in the data store which are not already
+        in the index, or have changed, to the index. Return the number of
+        files.
+        """
+        paths = self._find_new_data_files(datetime.datetime.fromtimestamp(0))
+        for path in paths:
+            try:
+                DataFile(path, self).digest
+            except IOError:  # deleted in the meantime
+                pass
+        return len(paths)
@@ -0,0 +1,170 @@
+"""
+Provides an on-disk index of the digests of files in local data stores, so
+that the content of a file which has not changed since its digest was
+calculated does not have to be read again.
+
+Each entry records, for the full path of a file and a digest algorithm, the
+inode number, size, modification and status-change times (in nanoseconds)
+of the file when its digest was calculated. An entry is only used if all of
+these match the current state of the file; otherwise the digest is
+calculated again and the entry replaced. Since a file can be modified
+without changing its size or (within the resolution of the filesystem
+clock) its modification time, an entry for a file modified shortly before
+its digest was calculated is not trusted, as in git's handling of "racily
+clean" files.
+
+The index is only a cache: if it cannot be read or written, digests are
+calculated from the file contents as before.
+
+
+:copyright: Copyright 2006-2015 by the Sumatra team, see doc/authors.txt
+:license: BSD 2-clause, see LICENSE for details.
+"""
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import time
+import sqlite3
+import threading
+
+RACY_INTERVAL = 2 * 10**9  # nanoseconds; files modified less than this before being hashed are re-hashed
+INDEX_VERSION = 2  # the index is emptied when opened by a version of Sumatra with a different layout
+
+
+def _nanoseconds(stats, name):
+    try:
+        return getattr(stats, "st_%s_ns" % name)
+    except AttributeError:  # Python 2
+        return int(getattr(stats, "st_%s" % name) * 1e9)
+
+
+def file_state(stats):
+    """Return the (inode, size, mtime_ns, ctime_ns) of a file, given its os.stat() result."""
+    return (stats.st_ino, stats.st_size, _nanoseconds(stats, "mtime"), _nanoseconds(stats, "ctime"))
+
+
+class FileIndex(object):
+    """
+    An index, stored in the SQLite database *path*, of the digests of files
+    identified by their full paths.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "FileIndex(%r)" % self.path
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _connect(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=1, check_same_thread=False)
+            try:
+                connection.execute("PRAGMA synchronous = OFF")  # losing recent entries in a crash is harmless
+                if connection.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+                    with connection:
+                        connection.execute("DROP TABLE IF EXISTS file_state")
+                        connection.execute("CREATE TABLE file_state ("
+                                           "path TEXT, algorithm TEXT, inode INTEGER, size INTEGER, "
+                                           "mtime_ns INTEGER, ctime_ns INTEGER, checked_ns INTEGER, "
+                                           "digest TEXT, PRIMARY KEY (path, algorithm))")
+                        connection.execute("PRAGMA user_version = %d" % INDEX_VERSION)
+            except sqlite3.OperationalError:  # e.g. locked, or the directory is read-only
+                connection.close()
+                raise
+            except sqlite3.DatabaseError:  # not a database, or corrupted
+                connection.close()
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    raise sqlite3.OperationalError("cannot replace file index %s" % self.path)
+                return self._connect()
+            self._connection = connection
+        return self._connection
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                return connection.execute(sql, args).fetchall()
+
+    def __len__(self):
+        try:
+            return self._execute("SELECT COUNT(*) FROM file_state")[0][0]
+        except sqlite3.Error:
+            return 0
+
+    def get(self, full_path, stats, algorithm):
+        """
+        Return the indexed digest, calculated with *algorithm*, of the file at
+        *full_path*, or None if the file is not in the index or has changed
+        since its digest was calculated. *stats* is the current os.stat()
+        result for the file.
+        """
+        try:
+            rows = self._execute("SELECT inode, size, mtime_ns, ctime_ns, checked_ns, digest "
+                                 "FROM file_state WHERE path = ? AND algorithm = ?",
+                                 (full_path, algorithm))
+        except sqlite3.Error:
+            return None
+        if not rows:
+            return None
+        inode, size, mtime_ns, ctime_ns, checked_ns, digest = rows[0]
+        if (inode, size, mtime_ns, ctime_ns) != file_state(stats):
+            return None
+        if checked_ns - mtime_ns < RACY_INTERVAL:
+            return None
+        return digest
+
+    def set(self, full_path, stats, algorithm, digest, checked_ns):
+        """
+        Store the digest of the file at *full_path*, calculated with
+        *algorithm* at time *checked_ns* (nanoseconds since the epoch) from
+        the file in the state given by *stats*.
+        """
+        try:
+            self._execute("INSERT OR REPLACE INTO file_state VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                          (full_path, algorithm) + file_state(stats) + (checked_ns, digest))
+        except sqlite3.Error:
+            pass
+
+    def digest(self, full_path, stats, algorithm, calculate):
+        """
+        Return the digest, calculated with *algorithm*, of the file at
+        *full_path*, from the index if the file is unchanged, otherwise by
+        calling *calculate()*, and updating the index.
+        """
+        digest = self.get(full_path, stats, algorithm)
+        if digest is None:
+            checked_ns = int(time.time() * 1e9)
+            digest = calculate()
+            self.set(full_path, stats, algorithm, digest, checked_ns)
+        return digest
+
+    def discard(self, full_path):
+        """Remove the entries for the file at *full_path*, if there are any."""
+        try:
+            self._execute("DELETE FROM file_state WHERE path = ?", (full_path,))
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        """Remove all entries from the index."""
+        try:
+            self._execute("DELETE FROM file_state")
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -17,7 +17,7 @@ import os
 import mimetypes
 from urllib.request import urlopen
 from ..core import component
-from .base import DataItem
+from .base import DataItem, read_chunks
 from .filesystem import FileSystemDataStore
 
 
@@ -30,6 +30,7 @@ class MirroredDataFile(DataItem):
     def __init__(self, path, store, creation=None):
         self.path = path
         self.full_path = os.path.join(store.root, path)
+        self.digest_algorithm = store.digest_algorithm
         if os.path.exists(self.full_path):
             stats = os.stat(self.full_path)
             self.size = stats.st_size
@@ -55,6 +56,17 @@ class MirroredDataFile(DataItem):
         return content
     content = property(fget=get_content)
 
+    def iter_content(self):
+        if os.path.exists(self.full_path):
+            f = open(self.full_path, 'rb')
+        else:
+            f = urlopen(self.url)
+        try:
+            for chunk in read_chunks(f):
+                yield chunk
+        finally:
+            f.close()
+
     @property
     def sorted_content(self):
         raise NotImplementedError
@@ -86,8 +98,7 @@ class MirroredFileSystemDataStore(FileSystemDataStore):
     def find_new_data(self, timestamp):
         """Finds newly created/changed data items"""
         new_files = self._find_new_data_files(timestamp)
-        return [MirroredDataFile(path, self).generate_key()
-                for path in new_files]
+        return self.generate_keys(*new_files)
 
     def delete(self, *keys):
         """Delete the files corresponding to the given keys."""
@@ -42,6 +42,22 @@ class Formatter(object):
         """
         return getattr(self, mode)()
 
+    def iter_format(self, mode='short'):
+        """
+        Format the records according to the given mode, returning an iterator
+        over successive pieces of the output.
+
+        Formatters which can produce output one record at a time do so in a
+        method called "iter_<mode>", so that output can start before all the
+        records have been retrieved. For other modes, the entire output is
+        produced as a single piece.
+        """
+        iter_method = getattr(self, "iter_" + mode, None)
+        if iter_method is None:
+            self.records = list(self.records)  # may need more than one pass
+            return iter([self.format(mode)])
+        return iter_method()
+
 
 def record2dict(record):
     """Convert a Sumatra record to nested dicts"""
@@ -132,9 +148,19 @@ def record2json(record, indent=None):
 class JSONFormatter(Formatter):
     name = "json"
 
+    def iter_short(self, indent=2):
+        yield "["
+        for i, record in enumerate(self.records):
+            if i > 0:
+                yield ",\n"
+            yield record2json(record, indent=indent)
+        yield "]"
+
+    def iter_long(self, indent=2):
+        return self.iter_short(indent=indent)
+
     def short(self, indent=2):
-        return "[" + ",\n".join(record2json(record, indent=indent)
-                                for record in self.records) + "]"
+        return "".join(self.iter_short(indent=indent))
 
     def long(self, indent=2):
         return self.short(indent=indent)
@@ -147,18 +173,26 @@ class TextFormatter(Formatter):
     """
     name = "text"
 
+    def iter_short(self):
+        for i, record in enumerate(self.records):
+            if i > 0:
+                yield "\n"
+            yield record.label
+
     def short(self):
         """Return a list of record labels, one per line."""
-        return "\n".join(record.label for record in self.records)
+        return "".join(self.iter_short())
 
     def long(self, text_width=80, left_column_width=17):
         """
         Return detailed information about a list of records, as text with a
         limited column width. Lines that are too long will be wrapped round.
         """
-        output = ""
+        return "".join(self.iter_long(text_width, left_column_width))
+
+    def iter_long(self, text_width=80, left_column_width=17):
         for record in self.records:
-            output += "-" * text_width + "\n"
+            output = "-" * text_width + "\n"
             left_column = []
             right_column = []
             for field in fields:
@@ -191,7 +225,7 @@ class TextFormatter(Formatter):
                 # import pdb; pdb.set_trace()
             for left, right in zip(left_column, right_column):
                 output += left + ": " + right + "\n"
-        return output
+            yield output
 
     def table(self):
         """
@@ -334,20 +368,34 @@ class HTMLFormatter(Formatter):
         """
         Return a list of record labels as an HTML unordered list.
         """
-        return "<ul>\n<li>" + "</li>\n<li>".join(record.label for record in self.records) + "</li>\n</ul>"
+        return "".join(self.iter_short())
+
+    def iter_short(self):
+        yield "<ul>\n<li>"
+        for i, record in enumerate(self.records):
+            if i > 0:
+                yield "</li>\n<li>"
+            yield record.label
+        yield "</li>\n</ul>"
 
     def long(self):
         """
         Return detailed information about a list of records as an HTML
         description list.
         """
-        def format_record(record):
+        return "".join(self.iter_long())
+
+    def iter_long(self):
+        yield "<dl>\n"
+        for i, record in enumerate(self.records):
             output = "  <dt>%s</dt>\n  <dd>\n    <dl>\n" % record.label
             for field in fields:
                 output += "      <dt>%s</dt><dd>%s</dd>\n" % (field, cgi.escape(str(getattr(record, field))))
             output += "    </dl>\n  </dd>"
-            return output
-        return "<dl>\n" + "\n".join(format_record(record) for record in self.records) + "\n</dl>"
+            if i > 0:
+                output = "\n" + output
+            yield output
+        yield "\n</dl>"
 
     def table(self):
         """
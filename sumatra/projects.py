@@ -34,17 +34,17 @@ import pickle
 from copy import deepcopy
 import uuid
 import sumatra
-import django
-import sqlite3
-import time
 import shutil
 import textwrap
+from glob import glob
 from datetime import datetime
 from importlib import import_module
 from sumatra.records import Record
 from sumatra import programs, datastore
 from sumatra.formatting import get_formatter, get_diff_formatter
 from sumatra.recordstore import DefaultRecordStore
+from sumatra.recordstore.spool import RecordSpool, transient_errors
+from sumatra.datastore.index import FileIndex
 from sumatra.versioncontrol import UncommittedModificationsError, get_working_copy, VersionControlError
 from sumatra.core import TIMESTAMP_FORMAT
 import mimetypes
@@ -79,7 +79,8 @@ class Project(object):
                  on_changed='error', description='', data_label=None,
                  input_datastore=None, label_generator='timestamp',
                  timestamp_format=TIMESTAMP_FORMAT,
-                 allow_command_line_parameters=True, plugins=[]):
+                 allow_command_line_parameters=True, plugins=[],
+                 digest_workers=None, digest_algorithm=None):
         self.path = os.getcwd()
         if not os.path.exists(".smt"):
             os.mkdir(".smt")
@@ -107,9 +108,12 @@ class Project(object):
         self.timestamp_format = timestamp_format
         self.sumatra_version = sumatra.__version__
         self.allow_command_line_parameters = allow_command_line_parameters
+        self.digest_workers = digest_workers
+        self.digest_algorithm = digest_algorithm
         self._most_recent = None
         self.plugins = []
         self.load_plugins(*plugins)
+        self.configure_data_stores()
         self.save()
         print("Sumatra project successfully set up")
 
@@ -129,7 +133,8 @@ class Project(object):
                      'default_main_file', 'on_changed', 'description',
                      'data_label', '_most_recent', 'input_datastore',
                      'label_generator', 'timestamp_format', 'sumatra_version',
-                     'allow_command_line_parameters', 'plugins'):
+                     'allow_command_line_parameters', 'plugins', 'digest_workers',
+                     'digest_algorithm'):
             try:
                 attr = getattr(self, name)
             except:
@@ -250,23 +255,77 @@ class Project(object):
         version = working_copy.current_version()
         return version, diff
 
+    @property
+    def file_index(self):
+        """Index of the digests of files in the project's local data stores."""
+        if not hasattr(self, "_file_index"):
+            self._file_index = FileIndex(os.path.join(self.path, ".smt", "file_index"))
+        return self._file_index
+
+    def configure_data_stores(self):
+        """
+        Make the project's local data stores look up the digests of unchanged
+        files in the project's file index, rather than reading the files, and
+        use the project's `digest_workers` and `digest_algorithm` settings,
+        if these are set.
+        """
+        # these settings are not present in projects from Sumatra 0.7
+        digest_workers = getattr(self, "digest_workers", None)
+        digest_algorithm = getattr(self, "digest_algorithm", None)
+        for store in (self.data_store, self.input_datastore):
+            if isinstance(store, datastore.FileSystemDataStore):
+                store.index = self.file_index
+                if digest_workers:
+                    store.digest_workers = digest_workers
+                if digest_algorithm:
+                    store.digest_algorithm = digest_algorithm
+
+    def rebuild_file_index(self):
+        """
+        Discard the file index, then add the digests of all the files in the
+        output data store. Return the number of files indexed.
+        """
+        self.file_index.clear()
+        self.configure_data_stores()
+        if isinstance(self.data_store, datastore.FileSystemDataStore):
+            return self.data_store.update_index()
+        return 0
+
+    @property
+    def spool(self):
+        """Records which could not yet be saved in the record store."""
+        return RecordSpool(os.path.join(self.path, ".smt", "spool"))
+
     def add_record(self, record):
-        """Add a simulation or analysis record."""
-        success = False
-        cnt = 0
-        max_tries = 200
-        sleep_seconds = 5
-        while not success and cnt < max_tries:
+        """
+        Add a simulation or analysis record. If the record store cannot be
+        reached, the record is kept in the project's spool, and saved by a
+        later call of this method or by flush_records().
+        """
+        spool = self.spool
+        if len(spool) == 0:
             try:
                 self.record_store.save(self.name, record)
-                success = True
-                self._most_recent = record.label
-            except (django.db.utils.DatabaseError, sqlite3.OperationalError):
-                print("Failed to save record due to database error. Trying again in {0} seconds. (Attempt {1}/{2})".format(sleep_seconds, cnt, max_tries))
-                time.sleep(sleep_seconds)
-                cnt += 1
-        if cnt == max_tries:
-            print("Reached maximum number of attempts to save record. Aborting.")
+            except transient_errors() as err:
+                spool.add(self.name, record)
+                print("Could not save record {0} ({1}). It will be saved by the next run, "
+                      "or by 'smt flush'.".format(record.label, err))
+        else:  # earlier records are waiting, and must be saved first
+            spool.add(self.name, record)
+            spool.flush(self.record_store)
+            n = len(spool)
+            if n > 0:
+                print("{0} record(s) are waiting to be saved in the record store. "
+                      "Run 'smt flush' to save them.".format(n))
+        self._most_recent = record.label
+
+    def flush_records(self, timeout=0):
+        """
+        Save the records waiting in the spool, retrying for up to *timeout*
+        seconds if the record store cannot be reached. Return the number of
+        records saved.
+        """
+        return self.spool.flush(self.record_store, timeout=timeout)
 
     def get_record(self, label):
         """Search for a record with the supplied label and return it if found.
@@ -302,15 +361,32 @@ class Project(object):
             records.reverse()
         return records
 
+    def iter_records(self, tags=None, reverse=False):
+        """
+        Return an iterator over the project's records, retrieving them from
+        the record store a batch at a time unless *reverse* is True.
+        """
+        if reverse:
+            return iter(self.find_records(tags=tags, reverse=True))
+        return self.record_store.iter_records(self.name, tags)
+
     # def find_data() here?
 
-    def format_records(self, format='text', mode='short', tags=None, reverse=False):
+    def iter_format_records(self, format='text', mode='short', tags=None, reverse=False):
+        """
+        Format the project's records, returning an iterator over successive
+        pieces of the output, so that output can be written as the records
+        are retrieved.
+        """
         if format=='text' and mode=='short':
-            return '\n'.join(self.get_labels(tags=tags, reverse=reverse))
+            return iter(['\n'.join(self.get_labels(tags=tags, reverse=reverse))])
         else:
-            records = self.find_records(tags=tags, reverse=reverse)
+            records = self.iter_records(tags=tags, reverse=reverse)
             formatter = get_formatter(format)(records, project=self, tags=tags)
-            return formatter.format(mode)
+            return formatter.iter_format(mode)
+
+    def format_records(self, format='text', mode='short', tags=None, reverse=False):
+        return "".join(self.iter_format_records(format, mode, tags, reverse))
 
     def most_recent(self):
         try:
@@ -350,13 +426,21 @@ class Project(object):
         formatter = get_diff_formatter()(diff)
         return formatter.format(mode)
 
-    def export(self):
+    def export(self, format="json", compress=False):
+        """
+        Export the project and its records to .smt/project_export.json and
+        .smt/records_export.<format>[.gz], one record at a time. *format* is
+        "json" for a JSON array or "jsonl" for one record per line.
+        """
         # copy the project data
         shutil.copy(".smt/project", ".smt/project_export.json")
-        # export the record data
-        f = open(".smt/records_export.json", 'w')
-        f.write(self.record_store.export(self.name))
-        f.close()
+        # export the record data, replacing any previous export
+        for filename in glob(".smt/records_export.*"):
+            os.remove(filename)
+        filename = ".smt/records_export.%s" % format
+        if compress:
+            filename += ".gz"
+        self.record_store.export_to_file(self.name, filename, format=format)
 
     def repeat(self, original_label, new_label=None):
         if original_label == 'last':
@@ -456,6 +540,7 @@ def _load_project_from_json(path):
         prj.load_plugins(*prj.plugins)
     else:
         prj.plugins = []
+    prj.configure_data_stores()
     return prj
 
 
@@ -6,9 +6,13 @@ methods (simple serialisation, relational database, etc.)
 Sub-packages/modules
 --------------------
 
+query        - provides the RecordQuery class
 shelve_store - provides the ShelveRecordStore class
+sqlite_store - provides the SQLiteRecordStore class
+jsonlines_store - provides the JSONLinesRecordStore class
 django_store - provides the DjangoRecordStore class (if Django is installed)
 http_store   - provides the HttpRecordStore class
+spool        - provides the RecordSpool class, for records waiting to be saved
 
 
 :copyright: Copyright 2006-2015 by the Sumatra team, see doc/authors.txt
@@ -18,7 +22,10 @@ from __future__ import unicode_literals
 
 from . import serialization
 from .base import RecordStore
+from .query import RecordQuery
 from .shelve_store import ShelveRecordStore
+from .sqlite_store import SQLiteRecordStore
+from .jsonlines_store import JSONLinesRecordStore
 try:
     from .django_store import DjangoRecordStore
     have_django = True
@@ -6,9 +6,11 @@ Provides base RecordStore class.
 :license: BSD 2-clause, see LICENSE for details.
 """
 from __future__ import unicode_literals
-from builtins import object
+from builtins import object, bytes
 
+import io
 from sumatra.recordstore import serialization
+from sumatra.recordstore.query import RecordQuery
 from sumatra.formatting import get_formatter
 from ..core import component_type
 
@@ -33,6 +35,23 @@ class RecordStore(object):
         """Retrieve the record with the given label from the given project."""
         raise NotImplementedError
 
+    def save_many(self, project_name, records):
+        """
+        Store the given records under the given project.
+
+        Subclasses should override this if they can store several records
+        more efficiently than by calling :meth:`save` for each one.
+        """
+        for record in records:
+            self.save(project_name, record)
+
+    def get_many(self, project_name, labels):
+        """
+        Retrieve the records with the given labels from the given project, in
+        the same order as the labels.
+        """
+        return [self.get(project_name, label) for label in labels]
+
     def list(self, project_name, tags=None):
         """
         Return a list of records for the given project.
@@ -42,6 +61,60 @@ class RecordStore(object):
         """
         raise NotImplementedError
 
+    def iter_records(self, project_name, tags=None, batch_size=100):
+        """
+        Return an iterator over the records for the given project, optionally
+        filtered by tags as for :meth:`list`.
+
+        Records are retrieved *batch_size* at a time, so that memory use does
+        not grow with the number of records in the project. Subclasses should
+        override this if they can fetch a batch of records more efficiently
+        than with :meth:`get_many`.
+        """
+        if tags and not isinstance(tags, list):
+            tags = [tags]
+        labels = self.labels(project_name)
+        for i in range(0, len(labels), batch_size):
+            for record in self.get_many(project_name, labels[i:i + batch_size]):
+                if not tags or any(tag in record.tags for tag in tags):
+                    yield record
+
+    def query(self, project_name, query=None):
+        """
+        Return a list of the records for the given project which satisfy the
+        given :class:`RecordQuery`, in the order and with the pagination it
+        specifies.
+
+        This default implementation applies the query to the records in
+        Python. Subclasses should override it to translate as much of the
+        query as they can into the native query mechanism of the backend.
+        """
+        query = query or RecordQuery()
+        return query.apply(self.iter_records(project_name, query.tags))
+
+    def count(self, project_name, query=None):
+        """
+        Return the number of records for the given project which satisfy the
+        given :class:`RecordQuery` (ignoring its *limit* and *offset*), or the
+        total number of records if no query is given.
+        """
+        if query is None:
+            return len(self.labels(project_name))
+        return sum(1 for record in self.iter_records(project_name, query.tags)
+                   if query.matches(record))
+
+    def fingerprints(self, project_name):
+        """
+        Return a dict mapping the labels of the records in the given project
+        to fingerprints of their content (see
+        :func:`serialization.record_fingerprint`).
+
+        Subclasses should override this if they store the fingerprints, so
+        that they can be obtained without retrieving every record.
+        """
+        return dict((record.label, serialization.record_fingerprint(record))
+                    for record in self.iter_records(project_name))
+
     def labels(self, project_name):
         """Return the labels of all records in the given project."""
         raise NotImplementedError
@@ -50,6 +123,11 @@ class RecordStore(object):
         """Delete the record with the given label from the given project."""
         raise NotImplementedError
 
+    def delete_many(self, project_name, labels):
+        """Delete the records with the given labels from the given project."""
+        for label in labels:
+            self.delete(project_name, label)
+
     def delete_all(self):
         """Delete all records from the store."""
         raise NotImplementedError
@@ -67,43 +145,79 @@ class RecordStore(object):
         json_formatter = get_formatter('json')(records)
         return json_formatter.long()
 
+    def iter_export(self, project_name, indent=2, format="json"):
+        """
+        Return an iterator over successive pieces of a JSON representation of
+        the project record store, which can be written out as they are
+        produced. *format* is "json" for a JSON array or "jsonl" for one
+        record per line.
+        """
+        return serialization.iter_encode_records(self.iter_records(project_name),
+                                                 format=format, indent=indent)
+
     def export(self, project_name, indent=2):
         """Returns a string with a JSON representation of the project record store."""
-        records = self.list(project_name)
-        return self.export_records(records, indent=indent)
+        return "".join(self.iter_export(project_name, indent=indent))
 
-    def import_(self, project_name, content):
+    def export_to_file(self, project_name, path, format="json", indent=2):
+        """
+        Write a JSON representation of the project record store to the file
+        *path* (gzip-compressed if *path* ends with ".gz"), one record at a
+        time. *format* is as for :meth:`iter_export`.
+        """
+        with serialization.open_export_file(path, "w") as fp:
+            for chunk in self.iter_export(project_name, indent=indent, format=format):
+                fp.write(chunk)
+
+    def import_(self, project_name, content, batch_size=100):
         """Import records in JSON format."""
-        records = serialization.decode_records(content)
+        if isinstance(content, bytes):
+            content = content.decode("utf-8")
+        self._import_records(project_name,
+                             serialization.iter_decode_records(io.StringIO(content)),
+                             batch_size)
+
+    def import_from_file(self, project_name, path, batch_size=100):
+        """
+        Import records from a file written by :meth:`export_to_file`, reading
+        and saving *batch_size* records at a time.
+        """
+        with serialization.open_export_file(path) as fp:
+            self._import_records(project_name, serialization.iter_decode_records(fp),
+                                 batch_size)
+
+    def _import_records(self, project_name, records, batch_size):
+        # need to check for duplicate record labels?
+        batch = []
         for record in records:
-            # need to check for duplicate record labels?
-            self.save(project_name, record)
+            batch.append(record)
+            if len(batch) == batch_size:
+                self.save_many(project_name, batch)
+                batch = []
+        if batch:
+            self.save_many(project_name, batch)
 
     def sync(self, other, project_name):
         """
         Synchronize two record stores so that they contain the same records for
         a given project.
 
-        Where the two stores have the same label (within a project) for
-        different records, those records will not be synced. The method
-        returns a list of non-synchronizable records (empty if the sync worked
-        perfectly).
+        Only records whose labels are missing from one of the stores are
+        transferred. Where the two stores have the same label (within a
+        project) for records with different content fingerprints, those
+        records will not be synced. The method returns a list of
+        non-synchronizable records (empty if the sync worked perfectly).
         """
         # what to do about syncing different Sumatra versions? Need to think about
         # schema versioning
-        self_labels = set(self.labels(project_name))
-        other_labels = set(other.labels(project_name))
-        only_in_self = self_labels.difference(other_labels)
-        only_in_other = other_labels.difference(self_labels)
-        in_both = self_labels.intersection(other_labels)
-        non_synchronizable = []
-        for label in in_both:
-            if self.get(project_name, label) != other.get(project_name, label):
-                non_synchronizable.append(label)
-        for label in only_in_self:
-            other.save(project_name, self.get(project_name, label))
-        for label in only_in_other:
-            self.save(project_name, other.get(project_name, label))
+        self_fingerprints = self.fingerprints(project_name)
+        other_fingerprints = other.fingerprints(project_name)
+        only_in_self = [label for label in self_fingerprints if label not in other_fingerprints]
+        only_in_other = [label for label in other_fingerprints if label not in self_fingerprints]
+        non_synchronizable = [label for label, fingerprint in self_fingerprints.items()
+                              if other_fingerprints.get(label, fingerprint) != fingerprint]
+        other.save_many(project_name, self.get_many(project_name, only_in_self))
+        self.save_many(project_name, other.get_many(project_name, only_in_other))
         return non_synchronizable
 
     def sync_all(self, other):
@@ -116,28 +230,47 @@ class RecordStore(object):
         """Does the store contain any records for the given project?"""
         raise NotImplementedError
 
-    def update(self, project_name, field, value, tags=None):
+    def update(self, project_name, field, value, tags=None, batch_size=100):
         """
         Modify the records for a given project.
 
         Arguments:
           *field*: the name of a record attribute, e.g. "datastore.root"
-          *value*:
+          *value*: the new value of the attribute
+          *tags*: if given, only records having one or more of these tags
+                  are modified.
         """
         # there is only a limited number of attributes that should be
         # modifiable, otherwise the whole point of using Sumatra for
         # reproducibility is lost. Should we perhaps mark only certain
         # attributes as modifiable?
-        # Note: this default implementation is likely to be slow. For most
-        #       subclasses it would be best to override this method.
-        for record in self.list(project_name, tags):
-            parts = field.split(".")
-            obj = record
-            for part in parts[:-1]:
-                obj = getattr(obj, part)
-            setattr(obj, parts[-1], value)
-            self.save(project_name, record)
+        # Note: this default implementation retrieves and saves every record,
+        #       batch_size records at a time. Subclasses should override it
+        #       where the store can modify the records in place.
+        if tags and not isinstance(tags, list):
+            tags = [tags]
+        parts = field.split(".")
+        labels = self.labels(project_name)
+        for start in range(0, len(labels), batch_size):
+            records = self.get_many(project_name, labels[start:start + batch_size])
+            if tags:
+                records = [record for record in records
+                           if any(tag in record.tags for tag in tags)]
+            for record in records:
+                obj = record
+                for part in parts[:-1]:
+                    obj = getattr(obj, part)
+                setattr(obj, parts[-1], value)
+            self.save_many(project_name, records)
 
 
 class RecordStoreAccessError(OSError):
     pass
+
+
+class RecordStoreUnavailableError(RecordStoreAccessError):
+    """
+    Raised when a record store server responds that it is temporarily
+    unable to handle a request, e.g. with "503 Service Unavailable".
+    """
+    pass
@@ -14,25 +14,95 @@ from future.standard_library import install_aliases
 install_aliases()
 from builtins import range
 from builtins import object
+from builtins import str
 
 
 import os
 import shutil
+import operator
+from functools import reduce
 from warnings import warn
 from textwrap import dedent
 import imp
-import django.conf as django_conf
-from django.core import management
-import django
 from sumatra.recordstore.base import RecordStore
+from sumatra.recordstore import serialization
+from sumatra.recordstore.query import RecordQuery
 from ...core import component
-from urllib.request import urlparse
+from urllib.parse import urlparse, parse_qsl
 from io import StringIO
 
-# Check that django-tagging is available. It would be better to try importing
-# it, but that seems to mess with Django's internals.
+# Check that Django and django-tagging are available. Django itself is only
+# imported when a DjangoRecordStore is used, as importing and configuring it
+# takes a significant fraction of the start-up time of smt. (Importing
+# django-tagging here would also mess with Django's internals.)
+imp.find_module("django")
 imp.find_module("tagging")
 
+# relations needed to build a Sumatra record from a database record, fetched
+# together with the records to avoid one query per record per relation
+RECORD_FOREIGN_KEYS = ("executable", "repository", "launch_mode", "datastore",
+                       "input_datastore", "parameters")
+RECORD_MANY_RELATIONS = ("input_data", "output_data", "dependencies", "platforms")
+
+# seconds for which PostgreSQL connections are kept open for reuse, unless
+# given in the record store URI
+DEFAULT_CONN_MAX_AGE = 60
+
+# fields which update() can modify with a few UPDATE statements, mapped to the
+# record relation and the datastore parameter which hold them
+DATASTORE_FIELDS = {
+    "datastore.root": ("datastore", "root"),
+    "input_datastore.root": ("input_datastore", "root"),
+    "datastore.archive": ("datastore", "archive"),
+    "datastore.mirror_base_url": ("datastore", "mirror_base_url"),
+}
+
+# table holding the value of schema_version() when the database was last
+# migrated, so that the (slow) migrate command is only run when needed
+SCHEMA_VERSION_TABLE = "sumatra_schema_version"
+
+# query criteria which can be evaluated by the database
+DJANGO_FILTERS = ("tags", "since", "until", "min_duration", "max_duration", "user",
+                  "main_file", "version", "outcome")
+
+
+def schema_version():
+    """
+    Return a string identifying the database schema expected by this version
+    of Sumatra: the name of the latest migration, together with the versions
+    of Django and django-tagging, whose tables are in the same database.
+    """
+    import django
+    import tagging
+    migrations_dir = os.path.join(os.path.dirname(__file__), "migrations")
+    migrations = sorted(name[:-3] for name in os.listdir(migrations_dir)
+                        if name.endswith(".py") and name != "__init__.py")
+    return "%s django-%s tagging-%s" % (migrations[-1], django.get_version(), tagging.__version__)
+
+
+def get_stored_schema_version(label):
+    """
+    Return the schema version recorded in the given database when it was
+    last migrated, or None.
+    """
+    from django.db import connections, DatabaseError
+    try:
+        with connections[label].cursor() as cursor:
+            cursor.execute("SELECT version FROM %s" % SCHEMA_VERSION_TABLE)
+            row = cursor.fetchone()
+    except DatabaseError:  # the table has not been created yet
+        return None
+    return row and row[0]
+
+
+def set_stored_schema_version(label, version):
+    from django.db import connections
+    with connections[label].cursor() as cursor:
+        cursor.execute("CREATE TABLE IF NOT EXISTS %s (version VARCHAR(255))" % SCHEMA_VERSION_TABLE)
+        cursor.execute("DELETE FROM %s" % SCHEMA_VERSION_TABLE)
+        if version:
+            cursor.execute("INSERT INTO %s (version) VALUES (%%s)" % SCHEMA_VERSION_TABLE, [version])
+
 
 def db_id(db):
     """Return a unique identifier for a database, for comparison purposes."""
@@ -65,6 +135,24 @@ class DjangoConfiguration(object):
         self._settings.update(kwargs)
 
     def uri_to_db(self, uri):
+        """
+        Convert a record store URI into a Django database settings dict.
+
+        For PostgreSQL, the URI query string may contain:
+
+          *conn_max_age*: number of seconds for which a connection is kept
+                          open for reuse (default 60), or "none" to keep it
+                          open indefinitely;
+          *pool_size*: if given, connections are taken from a pool which is
+                       shared by all threads of the process, and which holds
+                       at most this many connections. Connections are then
+                       returned to the pool at the end of each request,
+                       unless *conn_max_age* is also given;
+          *pool_min_size*: number of connections the pool keeps open (default 1);
+
+        any other parameters (e.g. "sslmode", "connect_timeout") are passed
+        to :func:`psycopg2.connect`.
+        """
         parse_result = urlparse(uri)
         db = {}
         if 'postgres' in parse_result.scheme:
@@ -74,6 +162,22 @@ class DjangoConfiguration(object):
             db['USER'] = parse_result.username
             db['PASSWORD'] = parse_result.password
             db['PORT'] = parse_result.port or ''
+            db['OPTIONS'] = {}
+            params = dict(parse_qsl(parse_result.query))
+            if 'pool_size' in params:
+                db['CONN_MAX_AGE'] = 0
+            else:
+                db['CONN_MAX_AGE'] = DEFAULT_CONN_MAX_AGE
+            for name, value in params.items():
+                if name == 'conn_max_age':
+                    db['CONN_MAX_AGE'] = None if value.lower() == 'none' else int(value)
+                elif name == 'pool_size':
+                    db['ENGINE'] = 'sumatra.recordstore.django_store.pooled_postgresql'
+                    db['POOL_SIZE'] = int(value)
+                elif name == 'pool_min_size':
+                    db['POOL_MIN_SIZE'] = int(value)
+                else:
+                    db['OPTIONS'][name] = value
         else:
             db['ENGINE'] = 'django.db.backends.sqlite3'
             db['NAME'] = os.path.abspath(parse_result.path)
@@ -111,17 +215,26 @@ class DjangoConfiguration(object):
         return db_id(db) in existing_dbs
 
     def _create_databases(self):
+        from django.core import management
+        from django.core.management.base import CommandError
         for label, db in self._settings['DATABASES'].items():
             if 'sqlite' in db['ENGINE']:
                 db_file = db['NAME']
                 if not os.path.exists(os.path.dirname(db_file)):
                     os.makedirs(os.path.dirname(db_file))
+            if get_stored_schema_version(label) == schema_version():
+                continue
             try:
-                management.call_command('migrate', database=label, verbosity=0)
-            except django.core.management.base.CommandError:
+                # databases created before Sumatra had migrations already
+                # contain the tables of the initial migration
+                management.call_command('migrate', database=label, verbosity=0, fake_initial=True)
+            except CommandError:
                 management.call_command('syncdb', database=label, verbosity=0)
+            set_stored_schema_version(label, schema_version())
 
     def configure(self):
+        import django
+        import django.conf as django_conf
         settings = django_conf.settings
         if not settings.configured:
             settings.configure(**self._settings)
@@ -148,6 +261,7 @@ class DjangoRecordStore(RecordStore):
     def __init__(self, db_file='.smt/records'):
         self._db_label = db_config.add_database(db_file)
         self._db_file = db_file
+        self._db_ids = {}  # cache of row ids, see _get_db_ids()
 
     def __str__(self):
         return "Django (%s)" % self._db_file
@@ -157,6 +271,7 @@ class DjangoRecordStore(RecordStore):
 
     def __setstate__(self, state):
         self._db_file = state['db_file']
+        self._db_ids = {}
         try:
             self._db_label = db_config.add_database(self._db_file)
         except:
@@ -171,6 +286,7 @@ class DjangoRecordStore(RecordStore):
     def _switch_db(self, db_file):
         # for testing
         global db_config
+        import django.conf as django_conf
         settings = django_conf.settings
         settings._wrapped = None
         assert settings.configured is False
@@ -183,6 +299,13 @@ class DjangoRecordStore(RecordStore):
         models = self._get_models()
         return models.Record.objects.using(self._db_label)
 
+    def _with_relations(self, db_records):
+        """
+        Fetch everything needed by Record.to_sumatra() with a fixed number of
+        queries, whatever the number of records.
+        """
+        return db_records.select_related(*RECORD_FOREIGN_KEYS).prefetch_related(*RECORD_MANY_RELATIONS)
+
     def _get_db_record(self, project_name, record):
         models = self._get_models()
         db_project = self._get_db_project(project_name)
@@ -210,6 +333,74 @@ class DjangoRecordStore(RecordStore):
             db_obj.save(using=self._db_label)
         return db_obj
 
+    def _get_db_ids(self, db_class, objs, cache=True):
+        """
+        Return the ids of the database rows matching the given Sumatra objects,
+        creating any rows that do not yet exist, using a fixed number of
+        queries however many objects there are.
+
+        Unless *cache* is False, the ids are remembered, keyed by the content
+        of each object, so that saving further records with the same
+        executable, repository, etc. requires no queries at all.
+        """
+        models = self._get_models()
+        cls = getattr(models, db_class)
+        return self._get_db_ids_for_attributes(
+            db_class, [cls.objects.attributes_from_sumatra_object(obj) for obj in objs], cache)
+
+    def _get_db_ids_for_attributes(self, db_class, attribute_dicts, cache=True):
+        """
+        As _get_db_ids(), but taking the field values of each row rather than
+        the Sumatra objects.
+        """
+        models = self._get_models()
+        cls = getattr(models, db_class)
+        field_names = cls.objects.field_names()
+        cached = self._db_ids.setdefault(db_class, {})
+        keys = []
+        missing = {}
+        for attributes in attribute_dicts:
+            key = self._content_key(cls, field_names, [attributes[name] for name in field_names])
+            keys.append(key)
+            if not (cache and key in cached):
+                missing[key] = attributes
+        ids = {}
+        if missing:
+            ids = self._find_db_ids(cls, field_names, missing)
+            new_keys = [key for key in missing if key not in ids]
+            if new_keys:
+                cls.objects.using(self._db_label).bulk_create(
+                    [cls(**missing[key]) for key in new_keys])
+                # not all databases return the ids of bulk-created rows
+                ids.update(self._find_db_ids(cls, field_names,
+                                             dict((key, missing[key]) for key in new_keys)))
+            if cache:
+                cached.update(ids)
+        return [ids[key] if key in ids else cached[key] for key in keys]
+
+    def _content_key(self, cls, field_names, values):
+        # normalise the values as the database would, e.g. integers stored in
+        # text fields, so that keys built from objects and from rows agree
+        return tuple(cls._meta.get_field(name).to_python(value)
+                     for name, value in zip(field_names, values))
+
+    def _find_db_ids(self, cls, field_names, missing):
+        """
+        Return a dict containing the ids of the existing rows for those of the
+        content keys in *missing* which have any, taking the oldest row where
+        there are duplicates.
+        """
+        from django.db.models import Q
+        ids = {}
+        items = list(missing.items())
+        chunk_size = max(1, 900 // len(field_names))  # SQLite limits the number of variables in a query
+        for i in range(0, len(items), chunk_size):
+            condition = reduce(operator.or_, (Q(**attributes) for key, attributes in items[i:i + chunk_size]))
+            db_rows = cls.objects.using(self._db_label).filter(condition).order_by('-pk')
+            for row in db_rows.values_list('pk', *field_names):
+                ids[self._content_key(cls, field_names, row[1:])] = row[0]
+        return dict((key, ids[key]) for key in missing if key in ids)
+
     def list_projects(self):
         models = self._get_models()
         return [project.id for project in models.Project.objects.using(self._db_label).all()]
@@ -219,59 +410,93 @@ class DjangoRecordStore(RecordStore):
         return bool(models.Project.objects.using(self._db_label).filter(id=project_name).count())
 
     def save(self, project_name, record):
+        self.save_many(project_name, [record])
+
+    def _save(self, project_name, record):
         db_record = self._get_db_record(project_name, record)
         for attr in 'reason', 'duration', 'outcome', 'main_file', 'version', 'timestamp':
             value = getattr(record, attr)
             if value is not None:
                 setattr(db_record, attr, value)
-        db_record.executable = self._get_db_obj('Executable', record.executable)
-        db_record.repository = self._get_db_obj('Repository', record.repository)
-        db_record.launch_mode = self._get_db_obj('LaunchMode', record.launch_mode)
-        db_record.datastore = self._get_db_obj('Datastore', record.datastore)
-        db_record.input_datastore = self._get_db_obj('Datastore', record.input_datastore)
-        db_record.parameters = self._get_db_obj('ParameterSet', record.parameters)
+        db_record.executable_id, = self._get_db_ids('Executable', [record.executable])
+        db_record.repository_id, = self._get_db_ids('Repository', [record.repository])
+        db_record.launch_mode_id, = self._get_db_ids('LaunchMode', [record.launch_mode])
+        db_record.datastore_id, db_record.input_datastore_id = self._get_db_ids(
+            'Datastore', [record.datastore, record.input_datastore])
+        db_record.parameters_id, = self._get_db_ids('ParameterSet', [record.parameters])
         db_record.script_arguments = record.script_arguments
         db_record.user = record.user
         db_record.tags = ",".join(record.tags)
         db_record.stdout_stderr = record.stdout_stderr
+        db_record.diff = record.diff
+        db_record.repeats = record.repeats
+        db_record.fingerprint = ""  # recalculated when next needed
         # should perhaps check here for any orphan Tags, i.e., those that are no longer associated with any records, and delete them
         db_record.save(using=self._db_label)  # need to save before using many-to-many relationship
+        # data keys are not cached, since they are deleted along with the
+        # record that produced them
         chunk_size = 900  # SQLite has problems with inserts >= ca. 1000, so for safety we split it into chunks
-        for i in range(0, len(record.input_data), chunk_size):
-            db_keys = (self._get_db_obj('DataKey', key) for key in record.input_data[i:i + chunk_size])
-            db_record.input_data.add(*db_keys)
-        for i in range(0, len(record.output_data), chunk_size):
-            db_keys = (self._get_db_obj('DataKey', key) for key in record.output_data[i:i + chunk_size])
-            for key in db_keys:
-                key.output_from_record = db_record
-                key.save()
+        input_ids = self._get_db_ids('DataKey', record.input_data, cache=False)
+        for i in range(0, len(input_ids), chunk_size):
+            db_record.input_data.add(*input_ids[i:i + chunk_size])
+        output_ids = self._get_db_ids('DataKey', record.output_data, cache=False)
+        models = self._get_models()
+        for i in range(0, len(output_ids), chunk_size):
+            models.DataKey.objects.using(self._db_label).filter(
+                pk__in=output_ids[i:i + chunk_size]).update(output_from_record=db_record)
         if record.dependencies:
-            for dep in record.dependencies:
-                # print "Adding dependency %s to db_record" % dep
-                db_record.dependencies.add(self._get_db_obj('Dependency', dep))
-        for pi in record.platforms:
-            db_record.platforms.add(self._get_db_obj('PlatformInformation', pi))
-        db_record.diff = record.diff
-        db_record.repeats = record.repeats
-        db_record.save(using=self._db_label)
+            db_record.dependencies.add(*self._get_db_ids('Dependency', record.dependencies))
+        if record.platforms:
+            db_record.platforms.add(*self._get_db_ids('PlatformInformation', record.platforms))
+
+    def save_many(self, project_name, records):
+        self._get_models()
+        from django.db import transaction
+        try:
+            with transaction.atomic(using=self._db_label):
+                for record in records:
+                    self._save(project_name, record)
+        except Exception:
+            # the cache may contain ids of rows whose creation was rolled back
+            self._db_ids.clear()
+            raise
 
     def get(self, project_name, label):
         models = self._get_models()
         try:
-            db_record = self._manager.get(project__id=project_name, label=label)
+            db_record = self._with_relations(self._manager).get(project__id=project_name, label=label)
         except models.Record.DoesNotExist:
             raise KeyError(label)
         return db_record.to_sumatra()
 
-    def list(self, project_name, tags=None):
-        db_records = self._manager.filter(project__id=project_name).select_related()
+    def get_many(self, project_name, labels):
+        labels = list(labels)
+        db_records = {}
+        chunk_size = 900  # SQLite limits the number of variables in a query
+        for i in range(0, len(labels), chunk_size):
+            for db_record in self._with_relations(
+                    self._manager.filter(project__id=project_name, label__in=labels[i:i + chunk_size])):
+                db_records[db_record.label] = db_record
+        return [db_records[label].to_sumatra() for label in labels]
+
+    def _filter(self, project_name, tags=None):
+        db_records = self._manager.filter(project__id=project_name)
         if tags:
-            if not hasattr(tags, "__len__"):
+            if not isinstance(tags, list):
                 tags = [tags]
-            for tag in tags:
-                db_records = db_records.filter(tags__contains=tag)
+            db_records = self._with_any_tag(db_records, tags)
+        return db_records
+
+    def _with_any_tag(self, db_records, tags):
+        models = self._get_models()
+        tagged = models.Record.tag_names.through.objects.using(self._db_label).filter(
+            recordtag__name__in=tags)
+        return db_records.filter(db_id__in=tagged.values("record_id"))
+
+    def _records_from_db(self, db_records):
         try:
-            records = [db_record.to_sumatra() for db_record in db_records]
+            for db_record in db_records:
+                yield db_record.to_sumatra()
         except Exception as err:
             errmsg = dedent("""\
                 Sumatra could not retrieve the record from the record store.
@@ -279,26 +504,128 @@ class DjangoRecordStore(RecordStore):
                 Please see http://packages.python.org/Sumatra/upgrading.html for information on upgrading.
                 The original error message was: '%s: %s'""" % (err.__class__.__name__, err))
             raise Exception(errmsg)
-        return records
+
+    def list(self, project_name, tags=None):
+        return list(self._records_from_db(self._with_relations(self._filter(project_name, tags))))
+
+    def iter_records(self, project_name, tags=None, batch_size=100):
+        # Each batch starts after the last record of the previous one, in an
+        # order made unique by db_id, since many records may have the same
+        # timestamp. Batches taken with OFFSET could overlap or leave gaps,
+        # as the database need not order tied records the same way each time,
+        # and records may be added while iterating.
+        from django.db.models import Q
+        db_records = self._with_relations(self._filter(project_name, tags)).order_by('-timestamp', '-db_id')
+        batch = list(db_records[:batch_size])
+        while batch:
+            for record in self._records_from_db(batch):
+                yield record
+            last = batch[-1]
+            batch = list(db_records.filter(Q(timestamp__lt=last.timestamp) |
+                                           Q(timestamp=last.timestamp, db_id__lt=last.db_id))[:batch_size])
 
     def labels(self, project_name, tags=None):
-        db_records = self._manager.filter(project__id=project_name).select_related()
-        if tags:
-            if not hasattr(tags, "__len__"):
-                tags = [tags]
-            for tag in tags:
-                db_records = db_records.filter(tags__contains=tag)
-        return [db_record.label for db_record in db_records]
+        return list(self._filter(project_name, tags).values_list("label", flat=True))
+
+    def fingerprints(self, project_name):
+        from django.db import transaction
+        db_records = self._manager.filter(project__id=project_name)
+        missing = db_records.filter(fingerprint="")
+        if missing.exists():
+            # the fingerprint is calculated from the record as it is retrieved
+            # from the database, so that it matches that of copies of the
+            # record in other stores
+            with transaction.atomic(using=self._db_label):
+                for db_record in self._with_relations(missing):
+                    fingerprint = serialization.record_fingerprint(db_record.to_sumatra())
+                    self._manager.filter(db_id=db_record.db_id).update(fingerprint=fingerprint)
+        return dict(db_records.values_list("label", "fingerprint"))
+
+    def _filter_query(self, project_name, query):
+        """Translate a RecordQuery, other than parameter values, into a QuerySet."""
+        db_records = self._manager.filter(project__id=project_name)
+        if query.tags:
+            db_records = self._with_any_tag(db_records, query.tags)
+        lookups = {"since": "timestamp__gte", "until": "timestamp__lt",
+                   "min_duration": "duration__gte", "max_duration": "duration__lte",
+                   "user": "user", "main_file": "main_file", "version": "version",
+                   "outcome": "outcome__icontains"}
+        for name, lookup in lookups.items():
+            value = getattr(query, name)
+            if value is not None:
+                db_records = db_records.filter(**{lookup: value})
+        return db_records.order_by(query.order_by)
+
+    def query(self, project_name, query=None):
+        query = query or RecordQuery()
+        db_records = self._with_relations(self._filter_query(project_name, query))
+        residual = query.without(*DJANGO_FILTERS)
+        if not residual.filters():
+            if query.limit is not None:
+                db_records = db_records[query.offset:query.offset + query.limit]
+            elif query.offset:
+                db_records = db_records[query.offset:]
+            return list(self._records_from_db(db_records))
+        # parameter sets are stored as text, so must be compared in Python
+        records = self._records_from_db(db_records)
+        return list(query.paginate(record for record in records if residual.matches(record)))
+
+    def count(self, project_name, query=None):
+        query = query or RecordQuery()
+        db_records = self._filter_query(project_name, query)
+        residual = query.without(*DJANGO_FILTERS)
+        if not residual.filters():
+            return db_records.count()
+        return sum(1 for record in self._records_from_db(self._with_relations(db_records))
+                   if residual.matches(record))
+
+    def update(self, project_name, field, value, tags=None, batch_size=100):
+        if field not in DATASTORE_FIELDS:
+            return super(DjangoRecordStore, self).update(project_name, field, value, tags, batch_size)
+        # datastores are shared between records, so rather than modifying
+        # each record we point them all at a modified copy of each datastore
+        from django.db import transaction
+        models = self._get_models()
+        relation, parameter = DATASTORE_FIELDS[field]
+        db_records = self._filter(project_name, tags)
+        try:
+            with transaction.atomic(using=self._db_label):
+                old_ids = set(db_records.values_list(relation, flat=True))
+                for db_datastore in models.Datastore.objects.using(self._db_label).filter(pk__in=old_ids):
+                    parameters = db_datastore.access_parameters()
+                    if parameter not in parameters:  # not an attribute of this type of datastore
+                        continue
+                    parameters[parameter] = value
+                    new_id, = self._get_db_ids_for_attributes(
+                        'Datastore', [{'type': db_datastore.type, 'parameters': str(parameters)}])
+                    db_records.filter(**{relation: db_datastore.pk}).update(
+                        **{relation: new_id, 'fingerprint': ""})
+        except Exception:
+            self._db_ids.clear()  # as in save_many()
+            raise
 
     def delete(self, project_name, label):
         db_record = self._manager.get(label=label, project__id=project_name)
         db_record.delete()
 
+    def delete_many(self, project_name, labels):
+        self._get_models()
+        from django.db import transaction
+        labels = list(labels)
+        chunk_size = 900
+        with transaction.atomic(using=self._db_label):
+            for i in range(0, len(labels), chunk_size):
+                chunk = labels[i:i + chunk_size]
+                db_records = self._manager.filter(project__id=project_name, label__in=chunk)
+                missing = set(chunk).difference(db_records.values_list('label', flat=True))
+                if missing:
+                    raise KeyError(missing.pop())
+                db_records.delete()
+
     def delete_by_tag(self, project_name, tag):
-        db_records = self._manager.filter(project__id=project_name, tags__contains=tag)
+        db_records = self._manager.filter(project__id=project_name, tag_names__name=tag)
         n = db_records.count()
-        for db_record in db_records:
-            db_record.delete()
+        db_records.delete()
         return n
 
     def most_recent(self, project_name):
@@ -307,6 +634,9 @@ class DjangoRecordStore(RecordStore):
 
     def delete_all(self):
         """Delete everything from the database."""
+        self._get_models()
+        from django.core import management
+        self._db_ids.clear()
         management.call_command('flush', database=self._db_label,
                                 interactive=False, verbosity=0)
 
@@ -318,15 +648,23 @@ class DjangoRecordStore(RecordStore):
         """
         if not db_config.configured:
             db_config.configure()
+        self._db_ids.clear()
         #management.call_command('sqlclear', 'django_store', database=self._db_label)  # this produces coloured output, need no_color option from Django 1.7
         cmds = ["BEGIN;"] + ['DROP TABLE "django_store_{0}";'.format(x)
                              for x in ("record", "record_input_data", "record_dependencies",
-                                       "record_platforms", "platforminformation", "datakey", "datastore", "launchmode",
+                                       "record_platforms", "record_tag_names", "recordtag", "platforminformation", "datakey", "datastore", "launchmode",
                                        "parameterset", "repository", "dependency", "executable", "project")] + ["COMMIT;"]
         from django.db import connection
         cur = connection.cursor()
         for cmd in cmds:
             cur.execute(cmd)
+        try:
+            from django.db.migrations.recorder import MigrationRecorder
+        except ImportError:  # Django < 1.7
+            pass
+        else:  # so that the tables are recreated by migrate
+            MigrationRecorder(connection).migration_qs.filter(app="django_store").delete()
+        set_stored_schema_version(connection.alias, None)
         db_config._create_databases()
 
     def _dump(self, indent=2):
@@ -334,6 +672,7 @@ class DjangoRecordStore(RecordStore):
         Dump the database contents to a JSON-encoded string
         """
         import sys
+        from django.core import management
         data = StringIO()
         sys.stdout = data
         management.call_command('dumpdata', 'django_store', 'tagging', indent=indent)
@@ -359,6 +698,7 @@ class DjangoRecordStore(RecordStore):
         Delete the database entirely.
         """
         self.backup()
+        self._db_ids.clear()
         if 'sqlite3' in db_config.engine:
             os.remove(self._db_file)
         else:
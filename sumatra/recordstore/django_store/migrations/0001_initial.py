@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import tagging.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataKey',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('path', models.CharField(max_length=200)),
+                ('digest', models.CharField(max_length=40)),
+                ('creation', models.DateTimeField(blank=True, null=True)),
+                ('metadata', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ('path',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Datastore',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('type', models.CharField(max_length=100)),
+                ('parameters', models.CharField(max_length=200)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Dependency',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('name', models.CharField(max_length=50)),
+                ('path', models.CharField(max_length=200)),
+                ('version', models.CharField(max_length=40)),
+                ('diff', models.TextField(blank=True)),
+                ('source', models.CharField(max_length=200, blank=True, null=True)),
+                ('module', models.CharField(max_length=50)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Executable',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('path', models.CharField(max_length=200)),
+                ('name', models.CharField(max_length=50)),
+                ('version', models.CharField(max_length=100)),
+                ('options', models.CharField(max_length=50)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='LaunchMode',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('type', models.CharField(max_length=100)),
+                ('parameters', models.CharField(max_length=1000)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ParameterSet',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('type', models.CharField(max_length=100)),
+                ('content', models.TextField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='PlatformInformation',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('architecture_bits', models.CharField(max_length=100)),
+                ('architecture_linkage', models.CharField(max_length=100)),
+                ('machine', models.CharField(max_length=20)),
+                ('network_name', models.CharField(max_length=100)),
+                ('ip_addr', models.GenericIPAddressField()),
+                ('processor', models.CharField(max_length=100)),
+                ('release', models.CharField(max_length=100)),
+                ('system_name', models.CharField(max_length=20)),
+                ('version', models.CharField(max_length=100)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Project',
+            fields=[
+                ('id', models.SlugField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ('id',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Record',
+            fields=[
+                ('label', models.CharField(max_length=100)),
+                ('db_id', models.AutoField(primary_key=True, serialize=False)),
+                ('reason', models.TextField(blank=True)),
+                ('duration', models.FloatField(null=True)),
+                ('main_file', models.CharField(max_length=100)),
+                ('version', models.CharField(max_length=50)),
+                ('outcome', models.TextField(blank=True)),
+                ('timestamp', models.DateTimeField()),
+                ('tags', tagging.fields.TagField(max_length=255, blank=True)),
+                ('diff', models.TextField(blank=True)),
+                ('user', models.CharField(max_length=100)),
+                ('script_arguments', models.TextField(blank=True)),
+                ('stdout_stderr', models.TextField(blank=True)),
+                ('repeats', models.CharField(max_length=100, blank=True, null=True)),
+                ('datastore', models.ForeignKey(to='django_store.Datastore')),
+                ('dependencies', models.ManyToManyField(to='django_store.Dependency')),
+                ('executable', models.ForeignKey(blank=True, null=True, to='django_store.Executable')),
+                ('input_data', models.ManyToManyField(related_name='input_to_records', to='django_store.DataKey')),
+                ('input_datastore', models.ForeignKey(related_name='input_to_records', to='django_store.Datastore')),
+                ('launch_mode', models.ForeignKey(to='django_store.LaunchMode')),
+                ('parameters', models.ForeignKey(to='django_store.ParameterSet')),
+                ('platforms', models.ManyToManyField(to='django_store.PlatformInformation')),
+                ('project', models.ForeignKey(null=True, to='django_store.Project')),
+            ],
+            options={
+                'ordering': ('-timestamp',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Repository',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('type', models.CharField(max_length=100)),
+                ('url', models.URLField()),
+                ('upstream', models.URLField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='repository',
+            field=models.ForeignKey(blank=True, null=True, to='django_store.Repository'),
+        ),
+        migrations.AddField(
+            model_name='datakey',
+            name='output_from_record',
+            field=models.ForeignKey(null=True, related_name='output_data', to='django_store.Record'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='fingerprint',
+            field=models.CharField(max_length=40, blank=True),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from tagging.utils import parse_tag_input
+
+
+def copy_tags(apps, schema_editor):
+    """Fill in the tag table from the existing tag strings."""
+    db = schema_editor.connection.alias
+    Record = apps.get_model('django_store', 'Record')
+    RecordTag = apps.get_model('django_store', 'RecordTag')
+    record_tags = dict((db_id, set(parse_tag_input(tags)))
+                       for db_id, tags in Record.objects.using(db).exclude(tags='').values_list('db_id', 'tags'))
+    names = set().union(*record_tags.values())
+    RecordTag.objects.using(db).bulk_create(RecordTag(name=name) for name in sorted(names))
+    tag_ids = dict(RecordTag.objects.using(db).values_list('name', 'id'))
+    Link = Record.tag_names.through
+    Link.objects.using(db).bulk_create(
+        Link(record_id=db_id, recordtag_id=tag_ids[name])
+        for db_id, tags in record_tags.items() for name in tags)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_store', '0002_record_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordTag',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+            options={
+                'ordering': ('name',),
+            },
+        ),
+        migrations.AlterField(
+            model_name='datakey',
+            name='creation',
+            field=models.DateTimeField(blank=True, null=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='datakey',
+            name='digest',
+            field=models.CharField(max_length=40, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='datakey',
+            name='path',
+            field=models.CharField(max_length=200, db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='record',
+            index_together=set([('project', 'timestamp'), ('project', 'label')]),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='tag_names',
+            field=models.ManyToManyField(related_name='records', to='django_store.RecordTag'),
+        ),
+        migrations.RunPython(copy_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_store', '0003_indexes_and_record_tags'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='datakey',
+            name='digest',
+            field=models.CharField(max_length=200, db_index=True),
+        ),
+    ]
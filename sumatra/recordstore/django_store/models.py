@@ -22,20 +22,34 @@ with warnings.catch_warnings():
     warnings.simplefilter("ignore")
     import tagging.fields
     from tagging.models import Tag
+    from tagging.utils import parse_tag_input
+
+
+# field names are looked up once per model, as this is relatively slow
+_field_names = {}
 
 
 class SumatraObjectsManager(models.Manager):
 
-    def get_or_create_from_sumatra_object(self, obj, using='default'):
+    def field_names(self):
+        """
+        Return the names of the fields which are set from the attributes of a
+        Sumatra object.
+        """
         # automatically retrieving the field names is nice, but leads
         # to all the special cases below when we have subclasses that we
         # want to store in a single table in the database.
         # might be better to specify the list of field names explicitly
         # as an argument to the Manager __init__().
-        excluded_fields = ('id', 'record', 'input_to_records', 'output_from_record', 'output_from_record_id')
-        field_names = set(self.model._meta.get_all_field_names()).difference(excluded_fields)
+        if self.model not in _field_names:
+            excluded_fields = ('id', 'record', 'input_to_records', 'output_from_record', 'output_from_record_id')
+            _field_names[self.model] = sorted(
+                set(self.model._meta.get_all_field_names()).difference(excluded_fields))
+        return _field_names[self.model]
+
+    def attributes_from_sumatra_object(self, obj):
         attributes = {}
-        for name in field_names:
+        for name in self.field_names():
             if name == 'metadata':
                 assert isinstance(obj.metadata, dict)
                 attributes[name] = json.dumps(obj.metadata, sort_keys=True)  # DataKey
@@ -51,7 +65,10 @@ class SumatraObjectsManager(models.Manager):
                         attributes[name] = str(obj)  # ParameterSet
                     else:
                         raise
-        return self.using(using).get_or_create(**attributes)
+        return attributes
+
+    def get_or_create_from_sumatra_object(self, obj, using='default'):
+        return self.using(using).get_or_create(**self.attributes_from_sumatra_object(obj))
 
 
 class BaseModel(models.Model):
@@ -61,10 +78,7 @@ class BaseModel(models.Model):
         abstract = True
 
     def field_names(self):
-        field_names = self._meta.get_all_field_names()
-        field_names.remove('id')
-        field_names.remove('record')
-        return field_names
+        return type(self).objects.field_names()
 
 
 class Project(BaseModel):
@@ -193,9 +207,9 @@ class Datastore(BaseModel):
 
 
 class DataKey(BaseModel):
-    path = models.CharField(max_length=200)
-    digest = models.CharField(max_length=40)
-    creation = models.DateTimeField(null=True, blank=True)
+    path = models.CharField(max_length=200, db_index=True)
+    digest = models.CharField(max_length=200, db_index=True)  # algorithm-tagged, e.g. "blake2b:..."
+    creation = models.DateTimeField(null=True, blank=True, db_index=True)
     metadata = models.TextField(blank=True)
     output_from_record = models.ForeignKey('Record', related_name='output_data',
                                            null=True)
@@ -240,6 +254,20 @@ class PlatformInformation(BaseModel):
         return launch.PlatformInformation(**pi)
 
 
+class RecordTag(models.Model):
+    """
+    Normalized copy of the tags in Record.tags, so that filtering records by
+    tag is an indexed join rather than a text search.
+    """
+    name = models.CharField(max_length=255, unique=True)
+
+    class Meta(object):
+        ordering = ('name',)
+
+    def __unicode__(self):
+        return self.name
+
+
 class Record(BaseModel):
     label = models.CharField(max_length=100, unique=False)  # make this a SlugField? samarkanov changed unique to False for the search form.
     db_id = models.AutoField(primary_key=True)  # django-tagging needs an integer as primary key - see http://code.google.com/p/django-tagging/issues/detail?id=15
@@ -257,6 +285,7 @@ class Record(BaseModel):
     outcome = models.TextField(blank=True)
     timestamp = models.DateTimeField()
     tags = tagging.fields.TagField()
+    tag_names = models.ManyToManyField(RecordTag, related_name='records')  # kept in step with tags by save()
     dependencies = models.ManyToManyField(Dependency)
     platforms = models.ManyToManyField(PlatformInformation)
     diff = models.TextField(blank=True)
@@ -265,12 +294,32 @@ class Record(BaseModel):
     script_arguments = models.TextField(blank=True)
     stdout_stderr = models.TextField(blank=True)
     repeats = models.CharField(max_length=100, null=True, blank=True)
+    fingerprint = models.CharField(max_length=40, blank=True)  # filled in lazily by DjangoRecordStore.fingerprints()
 
     # parameters which will be used in the fulltext search (see sumatra.web.services fulltext_search)
     params_search = ('label', 'reason', 'duration', 'main_file', 'outcome', 'user', 'tags')
 
     class Meta(object):
         ordering = ('-timestamp',)
+        index_together = [('project', 'label'), ('project', 'timestamp')]
+
+    def save(self, *args, **kwargs):
+        super(Record, self).save(*args, **kwargs)
+        self.update_tag_names()
+
+    def update_tag_names(self):
+        """Bring the tag_names relation into line with the tags string."""
+        names = set(parse_tag_input(self.tags))
+        if names == set(self.tag_names.values_list('name', flat=True)):
+            return
+        db = self._state.db
+        existing = set(RecordTag.objects.using(db).filter(name__in=names).values_list('name', flat=True))
+        for name in names - existing:
+            # not bulk_create(), as another process may be creating the same tag
+            RecordTag.objects.using(db).get_or_create(name=name)
+        self.tag_names.clear()
+        if names:
+            self.tag_names.add(*RecordTag.objects.using(db).filter(name__in=names))
 
     def to_sumatra(self):
         record = records.Record(
@@ -292,7 +341,9 @@ class Record(BaseModel):
         record.stdout_stderr = self.stdout_stderr
         record.duration = self.duration
         record.outcome = self.outcome
-        record.tags = set(tag.name for tag in Tag.objects.get_for_object(self))
+        # the tags column holds the same tag string that was used to create
+        # the Tag objects, so there is no need for another query
+        record.tags = set(parse_tag_input(self.tags))
         record.output_data = [key.to_sumatra() for key in self.output_data.all()]
         record.dependencies = [dep.to_sumatra() for dep in self.dependencies.all()]
         record.platforms = [pi.to_sumatra() for pi in self.platforms.all()]
@@ -0,0 +1,95 @@
+"""
+Pooled PostgreSQL backend for the DjangoRecordStore.
+
+The settings dict for the database may contain POOL_SIZE, the maximum number
+of connections in the pool, and POOL_MIN_SIZE, the number of connections
+kept open. When all connections are in use, a thread needing a connection
+waits for up to POOL_TIMEOUT seconds (default 30) for one to be returned.
+
+
+:copyright: Copyright 2006-2015 by the Sumatra team, see doc/authors.txt
+:license: BSD 2-clause, see LICENSE for details.
+"""
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import threading
+from psycopg2 import pool as psycopg2_pool
+from django.db.backends.postgresql_psycopg2 import base
+
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of psycopg2 connections which blocks, rather than
+    failing, when the maximum number of connections are in use.
+    """
+
+    def __init__(self, min_size, max_size, timeout, conn_params):
+        self._pool = psycopg2_pool.ThreadedConnectionPool(min_size, max_size, **conn_params)
+        self._available = threading.BoundedSemaphore(max_size)
+        self.timeout = timeout
+
+    def getconn(self):
+        # threading.Semaphore.acquire() only accepts a timeout in Python 3
+        try:
+            acquired = self._available.acquire(timeout=self.timeout)
+        except TypeError:
+            acquired = self._available.acquire()
+        if not acquired:
+            raise psycopg2_pool.PoolError("No database connection became available within %g s" % self.timeout)
+        try:
+            return self._pool.getconn()
+        except Exception:
+            self._available.release()
+            raise
+
+    def putconn(self, connection):
+        try:
+            # broken connections are discarded; any open transaction is
+            # rolled back by the pool
+            self._pool.putconn(connection, close=bool(connection.closed))
+        finally:
+            self._available.release()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(settings_dict, conn_params):
+    """
+    Return the pool for the given connection parameters, creating it if
+    necessary. Pools are not shared with forked child processes.
+    """
+    key = (os.getpid(), tuple(sorted((k, "%s" % v) for k, v in conn_params.items())))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(settings_dict.get('POOL_MIN_SIZE', 1),
+                                         settings_dict['POOL_SIZE'],
+                                         settings_dict.get('POOL_TIMEOUT', 30),
+                                         conn_params)
+        return _pools[key]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        connection = get_pool(self.settings_dict, conn_params).getconn()
+        if connection.autocommit:  # left so by a previous user; make it like a new connection
+            connection.autocommit = False
+        # as in the parent class
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                get_pool(self.settings_dict, self.get_connection_params()).putconn(self.connection)
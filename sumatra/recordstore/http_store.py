@@ -4,13 +4,42 @@ Handles storage of simulation/analysis records on a remote server using HTTP.
 The server should support the following URL structure and HTTP methods:
 
 /                                            GET
-/<project_name>/[?tags=<tag1>,<tag2>,...]    GET
+/<project_name>/[?tags=<tag1>,<tag2>,...]    GET, POST
 /<project_name>/tag/<tag>/                   GET, DELETE
 /<project_name>/<record_label>/              GET, PUT, DELETE
 
 and should both accept and return JSON-encoded data when the Accept header is
 "application/json".
 
+POSTing a list of records to the project URL, with media type
+"application/vnd.sumatra.record-list-v4+json", saves all of them in a single
+request. For servers that do not support this, the records are PUT one by one.
+
+Record queries (see recordstore.query) are sent as query parameters of a GET
+on the project URL, e.g. "?user=bob&min_duration=600&order_by=-timestamp&limit=50".
+A server that has applied all the parameters should echo them back as a
+"query" object in the project document. Otherwise, the query is applied on
+the client to the records the server returned.
+
+When getting the project document, the client also sends "fields=all" (or
+"fields=label" when only labels are needed) and "page_size=<n>". A server
+supporting these returns, in the "records" list, the records themselves (or
+objects containing just their labels) rather than their URLs, at most n at a
+time, with the URL of the next page, if any, as "next". With older servers,
+which only list record URLs, the client GETs each record separately.
+
+Records are cached on the client, together with the ETag the server returned
+for them, and are only downloaded again if the server does not answer a GET
+with "If-None-Match: <etag>" with "304 Not Modified". The names of projects
+known to exist on the server are also cached, so that saving a record takes
+a single request. When the cached records exceed a maximum total size, those
+least recently used are removed.
+
+Request bodies larger than a few kilobytes are sent gzip-compressed, with
+"Content-Encoding: gzip". If the server rejects a compressed body (with status
+400 or 415), it is sent again uncompressed, and compression is not used for
+further requests. Compressed responses are accepted with "Accept-Encoding".
+
 The required JSON structure can be seen in recordstore.serialization.
 
 
@@ -21,25 +50,60 @@ from __future__ import unicode_literals
 from future import standard_library
 standard_library.install_aliases()
 
+import os
+import json
+import time
+import zlib
+import hashlib
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from warnings import warn
-from urllib.parse import urlparse, urlunparse
+from urllib.parse import urlparse, urlunparse, urlencode, unquote
 try:
     import httplib2
     have_http = True
 except ImportError:
     have_http = False
-from sumatra.recordstore.base import RecordStore, RecordStoreAccessError
+from sumatra.recordstore.base import RecordStore, RecordStoreAccessError, RecordStoreUnavailableError
 from sumatra.recordstore import serialization
+from sumatra.recordstore.query import RecordQuery
 from ..core import conditional_component
 
 
 API_VERSION = 4
+PAGE_SIZE = 100  # number of records to ask for in each page of a project document
+DEFAULT_WORKERS = 4  # number of records fetched concurrently from servers that list record URLs
+RETRIES = 3  # number of times a GET which fails with a server error is retried
+RETRY_DELAY = 0.5  # seconds before the first retry; doubled for each further retry
+COMPRESSION_THRESHOLD = 4096  # request bodies of at least this many bytes are compressed
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "sumatra", "http")
+CACHE_SIZE = 100 * 1024 * 1024  # maximum size in bytes of the cached records for each server
+CACHE_PRUNE_FRACTION = 0.8  # when the cache is full, records are removed until it is this fraction of its maximum size
 
 
 def domain(url):
     return urlparse(url).netloc
 
 
+def access_error(status, message):
+    """
+    Return the exception to raise for a request which failed with *status*.
+    Server errors (5xx), which are also returned by a proxy in front of a
+    server which is down, are assumed to be temporary.
+    """
+    if status >= 500:
+        return RecordStoreUnavailableError(message)
+    return RecordStoreAccessError(message)
+
+
+def gzip_compress(data):
+    """Return *data* (bytes) compressed in the gzip format."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
 def process_url(url):
     """Strip out username and password if included in URL"""
     username = None
@@ -65,7 +129,7 @@ class HttpRecordStore(RecordStore):
 
     =========================================    ================
     /                                            GET
-    /<project_name>/[?tags=<tag1>,<tag2>,...]    GET
+    /<project_name>/[?tags=<tag1>,<tag2>,...]    GET, POST
     /<project_name>/tag/<tag>/                   GET, DELETE
     /<project_name>/<record_label>/              GET, PUT, DELETE
     =========================================    ================
@@ -73,22 +137,78 @@ class HttpRecordStore(RecordStore):
     and should both accept and return JSON-encoded data when the Accept header is
     "application/json".
 
+    POSTing a list of records to the project URL, with media type
+    "application/vnd.sumatra.record-list-v4+json", saves all of them in a
+    single request. For servers that do not support this, the records are PUT
+    one by one.
+
+    Record queries are sent as query parameters of a GET on the project URL.
+    A server that has applied all of them should echo the parameters back
+    as a "query" object in the project document; otherwise the query is
+    applied on the client.
+
+    The client asks for records to be included in the project document, in
+    pages, with the "fields" and "page_size" query parameters (see the
+    module documentation), and only GETs records one by one from servers
+    that do not support this.
+
+    Records which have to be fetched one by one are fetched by *workers*
+    threads at a time, each with its own connection. GET requests which fail
+    with a server error (5xx) are retried a few times.
+
+    Records and the names of existing projects are cached in a directory
+    for each server within *cache_dir*, which is shared by all the stores
+    using the same server. Records are revalidated with their ETag each
+    time they are retrieved. If *cache_dir* is None, the cache is in the
+    home directory of the current user (who may not be the user who created
+    the project, if it is shared). Set *cache_dir* to False to disable
+    caching. Once the cached records for a server take up more than
+    *cache_size* bytes, the least recently used are removed.
+
+    Large records are sent compressed, unless *compress* is False or the
+    server does not accept compressed request bodies.
+
     The required JSON structure can be seen in :mod:`recordstore.serialization`.
     """
 
     def __init__(self, server_url, username=None, password=None,
-                 disable_ssl_certificate_validation=True):
+                 disable_ssl_certificate_validation=True, workers=DEFAULT_WORKERS,
+                 cache_dir=None, compress=True, cache_size=CACHE_SIZE):
         self.server_url, _username, _password = process_url(server_url)
-        username = username or _username
-        password = password or _password
+        self._username = username or _username
+        self._password = password or _password
+        self._disable_ssl_certificate_validation = disable_ssl_certificate_validation
         if self.server_url[-1] != "/":
             self.server_url += "/"
-        self.client = httplib2.Http(
-            '.cache',
-            disable_ssl_certificate_validation=disable_ssl_certificate_validation
+        self.workers = workers
+        self.compress = compress
+        self.cache_dir = cache_dir  # None is saved as such, not as the current user's cache directory
+        if cache_dir is None:
+            cache_dir = CACHE_DIR
+        self.cache_size = cache_size
+        self._cache_path = None
+        self._cache_lock = threading.Lock()
+        self._cache_bytes = None  # estimated size of the cached records, None until measured
+        if cache_dir:
+            self._cache_path = os.path.join(cache_dir,
+                                            hashlib.sha1(self.server_url.encode("utf-8")).hexdigest())
+        self._known_projects = self._read_known_projects()
+        self.client = self._new_client()
+        self._local = threading.local()  # clients for worker threads, as httplib2.Http is not thread-safe
+
+    def _new_client(self):
+        # caching is done by the store, see _get_record()
+        client = httplib2.Http(
+            disable_ssl_certificate_validation=self._disable_ssl_certificate_validation
         )
-        if username:
-            self.client.add_credentials(username, password, domain(self.server_url))
+        if self._username:
+            client.add_credentials(self._username, self._password, domain(self.server_url))
+        return client
+
+    def _thread_client(self):
+        if not hasattr(self._local, "client"):
+            self._local.client = self._new_client()
+        return self._local.client
 
     def __str__(self):
         return "Interface to remote record store at %s using HTTP" % self.server_url
@@ -102,20 +222,171 @@ class HttpRecordStore(RecordStore):
             'server_url': self.server_url,
             'username': username,
             'password': password,
+            'workers': self.workers,
+            'cache_dir': self.cache_dir,
+            'compress': self.compress,
+            'cache_size': self.cache_size,
         }
 
     def __setstate__(self, state):
-        self.__init__(state['server_url'], state['username'], state['password'])
+        self.__init__(state['server_url'], state['username'], state['password'],
+                      workers=state.get('workers', DEFAULT_WORKERS),
+                      cache_dir=state.get('cache_dir'),
+                      compress=state.get('compress', True),
+                      cache_size=state.get('cache_size', CACHE_SIZE))
 
-    def _get(self, url, media_type):
-        headers = {'Accept': 'application/vnd.sumatra.%s-v%d+json, application/json' % (media_type, API_VERSION)}
-        response, content = self.client.request(url, headers=headers)
+    def _write_cache_file(self, path, data):
+        """
+        Write *data* as JSON to a file in the cache, replacing it atomically,
+        as the cache may be shared with other processes. Return the size of
+        the file, or zero if it could not be written.
+        """
+        path = os.path.join(self._cache_path, path)
+        dir_name = os.path.dirname(path)
+        try:
+            try:
+                os.makedirs(dir_name)
+            except OSError:
+                if not os.path.isdir(dir_name):
+                    raise
+            fd, tmp_path = tempfile.mkstemp(dir=dir_name)
+            with os.fdopen(fd, "w") as fp:
+                json.dump(data, fp)
+                size = fp.tell()
+            getattr(os, "replace", os.rename)(tmp_path, path)
+        except (IOError, OSError) as err:  # the cache is an optimization only
+            warn("Unable to write to the record store cache: %s" % err)
+            return 0
+        return size
+
+    def _read_cache_file(self, path):
+        if self._cache_path is None:
+            return None
+        try:
+            with open(os.path.join(self._cache_path, path)) as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _record_cache_path(self, url):
+        return os.path.join("records", hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+    def _cache_record(self, cache_path, data):
+        """
+        Add a record to the cache, removing the least recently used records
+        if the cache has grown beyond its maximum size.
+        """
+        size = self._write_cache_file(cache_path, data)
+        with self._cache_lock:
+            if self._cache_bytes is not None:
+                self._cache_bytes += size
+            if self._cache_bytes is None or self._cache_bytes > self.cache_size:
+                self._cache_bytes = self._prune_cache()
+
+    def _prune_cache(self):
+        """
+        Remove the least recently used records from the cache if they take up
+        more than the maximum size, and return the size of those remaining.
+        The cache may be shared with other processes, so it is measured
+        rather than relying on what this store has written to it.
+        """
+        records_dir = os.path.join(self._cache_path, "records")
+        entries = []
+        try:
+            names = os.listdir(records_dir)
+        except OSError:
+            return 0
+        for name in names:
+            path = os.path.join(records_dir, name)
+            try:
+                stats = os.stat(path)
+            except OSError:  # removed by another process
+                continue
+            entries.append((stats.st_mtime, stats.st_size, path))
+        total = sum(size for mtime, size, path in entries)
+        if total > self.cache_size:
+            target = self.cache_size * CACHE_PRUNE_FRACTION
+            for mtime, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+        return total
+
+    def _touch_record(self, cache_path):
+        """Mark a cached record as recently used."""
+        try:
+            os.utime(os.path.join(self._cache_path, cache_path), None)
+        except OSError:
+            pass
+
+    def _forget_record(self, url):
+        if self._cache_path:
+            try:
+                os.remove(os.path.join(self._cache_path, self._record_cache_path(url)))
+            except OSError:
+                pass
+
+    def _read_known_projects(self):
+        return set(self._read_cache_file("projects.json") or [])
+
+    def _write_known_projects(self):
+        if self._cache_path:
+            self._write_cache_file("projects.json", sorted(self._known_projects))
+
+    def _ensure_project(self, project_name):
+        """Create the project on the server, unless it is known to exist."""
+        if project_name in self._known_projects:
+            return
+        if not self.has_project(project_name):
+            self.create_project(project_name)
+        self._known_projects = self._read_known_projects()  # may have been updated by another process
+        self._known_projects.add(project_name)
+        self._write_known_projects()
+
+    def _forget_project(self, project_name):
+        self._known_projects.discard(project_name)
+        self._write_known_projects()
+
+    def _get(self, url, media_type, client=None, extra_headers=None):
+        client = client or self.client
+        headers = {'Accept': 'application/vnd.sumatra.%s-v%d+json, application/json' % (media_type, API_VERSION),
+                   'Accept-Encoding': 'gzip, deflate'}  # httplib2 decompresses the response
+        headers.update(extra_headers or {})
+        delay = RETRY_DELAY
+        for attempt in range(RETRIES + 1):
+            response, content = client.request(url, headers=headers)
+            if response.status < 500 or attempt == RETRIES:
+                break
+            time.sleep(delay)
+            delay *= 2
         return response, content
 
+    def _send(self, url, method, data, headers):
+        """
+        PUT or POST *data*, compressed if it is large and the server accepts
+        compressed request bodies.
+        """
+        data = data.encode("utf-8")
+        if self.compress and len(data) >= COMPRESSION_THRESHOLD:
+            compressed_headers = dict(headers, **{'Content-Encoding': 'gzip'})
+            response, content = self.client.request(url, method, gzip_compress(data),
+                                                    headers=compressed_headers)
+            if response.status not in (400, 415):
+                return response, content
+            response, content = self.client.request(url, method, data, headers=headers)
+            if response.status < 400:  # the server does not support compressed request bodies
+                self.compress = False
+            return response, content
+        return self.client.request(url, method, data, headers=headers)
+
     def list_projects(self):
         response, content = self._get(self.server_url, 'project-list')
         if response.status != 200:
-            raise RecordStoreAccessError("Error in accessing %s\n%s: %s" % (self.server_url, response.status, content))
+            raise access_error(response.status, "Error in accessing %s\n%s: %s" % (self.server_url, response.status, content))
         return [entry['id'] for entry in serialization.decode_project_list(content)]
 
     def _put_project(self, project_name, long_name='', description=''):
@@ -130,13 +401,13 @@ class HttpRecordStore(RecordStore):
         """Create an empty project in the record store."""
         response, content = self._put_project(project_name, long_name, description)
         if response.status != 201:
-            raise RecordStoreAccessError("%d\n%s" % (response.status, content))
+            raise access_error(response.status, "%d\n%s" % (response.status, content))
 
     def update_project_info(self, project_name, long_name='', description=''):
         """Update a project's long name and description."""
         response, content = self._put_project(project_name, long_name, description)
         if response.status != 200:
-            raise RecordStoreAccessError("%d\n%s" % (response.status, content))
+            raise access_error(response.status, "%d\n%s" % (response.status, content))
 
     def has_project(self, project_name):
         project_url = "%s%s/" % (self.server_url, project_name)
@@ -146,70 +417,209 @@ class HttpRecordStore(RecordStore):
         elif response.status in (401, 404):
             return False
         else:
-            raise RecordStoreAccessError("%d\n%s" % (response.status, content))
+            raise access_error(response.status, "%d\n%s" % (response.status, content))
 
     def project_info(self, project_name):
         """Return a project's long name and description."""
         project_url = "%s%s/" % (self.server_url, project_name)
         response, content = self._get(project_url, 'project')
         if response.status != 200:
-            raise RecordStoreAccessError("Error in accessing %s\n%s: %s" % (project_url, response.status, content))
+            raise access_error(response.status, "Error in accessing %s\n%s: %s" % (project_url, response.status, content))
         data = serialization.decode_project_data(content)
         return dict((k, data[k]) for k in ("name", "description"))
 
-    def save(self, project_name, record):
-        if not self.has_project(project_name):
-            self.create_project(project_name)
+    def _put_record(self, project_name, record):
         url = "%s%s/%s/" % (self.server_url, project_name, record.label)
         headers = {'Content-Type': 'application/vnd.sumatra.record-v%d+json' % API_VERSION}
         data = serialization.encode_record(record)
-        response, content = self.client.request(url, 'PUT', data,
-                                                headers=headers)
+        self._forget_record(url)
+        response, content = self._send(url, 'PUT', data, headers)
+        if response.status == 404 and project_name in self._known_projects:
+            # the project has been deleted since we last checked
+            self._forget_project(project_name)
+            self._ensure_project(project_name)
+            response, content = self._send(url, 'PUT', data, headers)
         if response.status not in (200, 201):
-            raise RecordStoreAccessError("%d\n%s" % (response.status, content))
+            raise access_error(response.status, "%d\n%s" % (response.status, content))
 
-    def _get_record(self, url):
-        response, content = self._get(url, 'record')
-        if response.status != 200:
-            if response.status == 404:
-                raise KeyError("No record was found at %s" % url)
-            else:
-                raise RecordStoreAccessError("%d\n%s" % (response.status, content))
+    def save(self, project_name, record):
+        self._ensure_project(project_name)
+        self._put_record(project_name, record)
+
+    def save_many(self, project_name, records):
+        records = list(records)
+        if not records:
+            return
+        self._ensure_project(project_name)
+        url = "%s%s/" % (self.server_url, project_name)
+        headers = {'Content-Type': 'application/vnd.sumatra.record-list-v%d+json' % API_VERSION}
+        data = serialization.encode_records(records)
+        for record in records:
+            self._forget_record("%s%s/" % (url, record.label))
+        response, content = self._send(url, 'POST', data, headers)
+        if response.status in (404, 405, 415, 501):  # server does not support batch upload
+            for record in records:
+                self._put_record(project_name, record)
+        elif response.status not in (200, 201, 204):
+            raise access_error(response.status, "%d\n%s" % (response.status, content))
+
+    def _get_record(self, url, client=None):
+        cache_path = self._record_cache_path(url)
+        cached = self._read_cache_file(cache_path)
+        extra_headers = {}
+        if cached:
+            extra_headers['If-None-Match'] = cached["etag"]
+        response, content = self._get(url, 'record', client, extra_headers)
+        if response.status == 304 and cached:
+            content = cached["content"]
+            self._touch_record(cache_path)
+        elif response.status == 200:
+            if self._cache_path and response.get('etag'):
+                if isinstance(content, bytes):
+                    content = content.decode("utf-8")
+                self._cache_record(cache_path, {"etag": response['etag'], "content": content})
+        elif response.status == 404:
+            self._forget_record(url)
+            raise KeyError("No record was found at %s" % url)
+        else:
+            raise access_error(response.status, "%d\n%s" % (response.status, content))
         return serialization.decode_record(content)
 
     def get(self, project_name, label):
         url = "%s%s/%s/" % (self.server_url, project_name, label)
         return self._get_record(url)
 
-    def list(self, project_name, tags=None):
-        project_url = "%s%s/" % (self.server_url, project_name)
-        if tags:
-            if not isinstance(tags, list):
-                tags = [tags]
-            project_url += "?tags=%s" % ",".join(tags)
-        response, content = self._get(project_url, 'project')
+    def get_many(self, project_name, labels):
+        return list(self._get_records("%s%s/%s/" % (self.server_url, project_name, label)
+                                      for label in labels))
+
+    def _get_project_data(self, url):
+        response, content = self._get(url, 'project')
         if response.status != 200:
-            raise RecordStoreAccessError("Could not access %s\n%s: %s" % (project_url, response.status, content))
-        record_urls = serialization.decode_project_data(content)["records"]
-        records = []
-        for record_url in record_urls:
-            records.append(self._get_record(record_url))
-        return records
+            raise access_error(response.status, "Could not access %s\n%s: %s" % (url, response.status, content))
+        return serialization.decode_project_data(content)
+
+    def _record_entries(self, project_name, params=(), fields="all", page_size=PAGE_SIZE):
+        """
+        Return the (first page of the) project document for the given query
+        parameters, and an iterator over the entries in its "records" list,
+        following the links to further pages.
+
+        Depending on the server, the entries are either record URLs or
+        objects containing the requested *fields* of each record.
+        """
+        params = list(params) + [("fields", fields), ("page_size", "%d" % page_size)]
+        url = "%s%s/?%s" % (self.server_url, project_name, urlencode(params))
+        project_data = self._get_project_data(url)
+
+        def entries(page):
+            while True:
+                for entry in page["records"]:
+                    yield entry
+                if not page.get("next"):
+                    break
+                page = self._get_project_data(page["next"])
+        return project_data, entries(project_data)
+
+    def _get_records(self, urls):
+        """
+        Return an iterator over the records at the given URLs, in the same
+        order, fetching up to self.workers of them at a time, and with at most
+        twice that number of requests submitted but not yet consumed.
+        """
+        if self.workers <= 1:
+            for url in urls:
+                yield self._get_record(url)
+            return
+
+        def get_record(url):
+            return self._get_record(url, self._thread_client())
+
+        executor = ThreadPoolExecutor(self.workers)
+        pending = deque()
+        try:
+            for url in urls:
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(get_record, url))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:  # if the caller stopped early, or there was an error
+                future.cancel()
+            executor.shutdown()
+
+    def _records_from_entries(self, entries):
+        urls = []
+        decoder = serialization.RecordDecoder()
+        for entry in entries:
+            if isinstance(entry, dict):
+                yield decoder.build_record(entry)
+            else:  # older servers only list the record URLs
+                urls.append(entry)
+        for record in self._get_records(urls):
+            yield record
+
+    def _tag_params(self, tags):
+        if not tags:
+            return []
+        if not isinstance(tags, list):
+            tags = [tags]
+        return [("tags", ",".join(tags))]
+
+    def list(self, project_name, tags=None):
+        return list(self.iter_records(project_name, tags))
+
+    def iter_records(self, project_name, tags=None, batch_size=100):
+        project_data, entries = self._record_entries(project_name, self._tag_params(tags),
+                                                     page_size=batch_size)
+        return self._records_from_entries(entries)
 
     def labels(self, project_name):
-        return [record.label for record in self.list(project_name)]  # probably inefficient
+        project_data, entries = self._record_entries(project_name, fields="label")
+        # record URLs have the form <server_url>/<project_name>/<label>/
+        return [entry["label"] if isinstance(entry, dict)
+                else unquote(urlparse(entry).path.rstrip("/").split("/")[-1])
+                for entry in entries]
+
+    def _query_entries(self, project_name, query, paginate=True, fields="all"):
+        """
+        Return an iterator over the entries the server selects for the given
+        query, and whether the server has applied the whole query.
+        """
+        params = query.to_query_params(paginate=paginate)
+        project_data, entries = self._record_entries(project_name, params, fields)
+        return entries, project_data.get("query") == dict(params)
+
+    def query(self, project_name, query=None):
+        query = query or RecordQuery()
+        entries, applied = self._query_entries(project_name, query)
+        records = self._records_from_entries(entries)
+        if applied:
+            return list(records)
+        return query.apply(records)
+
+    def count(self, project_name, query=None):
+        query = query or RecordQuery()
+        entries, applied = self._query_entries(project_name, query, paginate=False, fields="label")
+        if applied:
+            return sum(1 for entry in entries)
+        entries, applied = self._query_entries(project_name, query, paginate=False)
+        return sum(1 for record in self._records_from_entries(entries)
+                   if query.matches(record))
 
     def delete(self, project_name, label):
         url = "%s%s/%s/" % (self.server_url, project_name, label)
+        self._forget_record(url)
         response, deleted_content = self.client.request(url, 'DELETE')
         if response.status != 204:
-            raise RecordStoreAccessError("%d\n%s" % (response.status, deleted_content))
+            raise access_error(response.status, "%d\n%s" % (response.status, deleted_content))
 
     def delete_by_tag(self, project_name, tag):
         url = "%s%s/tag/%s/" % (self.server_url, project_name, tag)
         response, n_records = self.client.request(url, 'DELETE')
         if response.status != 200:
-            raise RecordStoreAccessError("%d\n%s" % (response.status, n_records))
+            raise access_error(response.status, "%d\n%s" % (response.status, n_records))
         return int(n_records)
 
     def most_recent(self, project_name):
@@ -217,9 +627,8 @@ class HttpRecordStore(RecordStore):
         return self._get_record(url).label
 
     def sync(self, other, project_name):
-        if not self.has_project(project_name):
-            self.create_project(project_name)
-        super(HttpRecordStore, self).sync(other, project_name)
+        self._ensure_project(project_name)
+        return super(HttpRecordStore, self).sync(other, project_name)
 
     def clear(self):
         warn("Cannot clear a remote record store directly. Contact the record store administrator")
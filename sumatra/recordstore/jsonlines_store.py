@@ -0,0 +1,338 @@
+"""
+Handles storage of simulation/analysis records in an append-only log of JSON
+documents, one per line.
+
+Every save or delete appends a single line to the log, so writes take
+constant time and many processes (e.g. cluster jobs writing to a shared
+filesystem) can add records without locking. An index mapping record labels
+to their position in the log is kept in memory, and is persisted in a sidecar
+file so that only the end of the log needs to be read when the store is
+opened.
+
+
+:copyright: Copyright 2006-2015 by the Sumatra team, see doc/authors.txt
+:license: BSD 2-clause, see LICENSE for details.
+"""
+from __future__ import unicode_literals
+
+import os
+import time
+import errno
+import json
+import shutil
+import uuid
+import logging
+from sumatra.recordstore.base import RecordStore
+from sumatra.recordstore import serialization
+from sumatra.formatting import record2dict
+from ..core import component
+
+logger = logging.getLogger("Sumatra")
+
+
+LOG_FORMAT_VERSION = 1
+INDEX_FORMAT_VERSION = 2
+# the index sidecar is rewritten when opening the store if more than this
+# number of log entries had to be replayed
+INDEX_REFRESH_ENTRIES = 1000
+# number of times to wait for the header of a log just created by another process
+HEADER_RETRIES = 50
+
+
+def _encode_line(data):
+    return (json.dumps(data, sort_keys=True) + "\n").encode("utf-8")
+
+
+@component
+class JSONLinesRecordStore(RecordStore):
+    """
+    Handles storage of simulation/analysis records in an append-only file
+    containing one JSON document per line.
+
+    Saving or deleting a record appends a line to the file using a single
+    atomic, append-mode write, so no locking is needed when several
+    computations write to the same store. Deleted and overwritten records
+    remain in the file until :meth:`compact` is called, which should only
+    be done when no other process is writing to the store.
+    """
+
+    def __init__(self, log_file=".smt/records.jsonl"):
+        self._log_file = os.path.abspath(log_file)
+        self._index_file = self._log_file + ".index"
+        dir = os.path.dirname(self._log_file)
+        if not os.path.exists(dir):
+            os.makedirs(dir)
+        self._create_log()
+        self._load_index()
+
+    def __str__(self):
+        return "Record store using an append-only JSON-lines file (file=%s)" % self._log_file
+
+    def __getstate__(self):
+        return {'log_file': self._log_file}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _create_log(self):
+        """
+        Create an empty log, containing only a header line, unless it already
+        exists. Creation is exclusive, so if several processes open a new
+        store at the same time, only one creates the log and none of them
+        replaces a log another has already written to.
+        """
+        try:
+            fd = os.open(self._log_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY | os.O_APPEND)
+        except OSError as err:
+            if err.errno == errno.EEXIST:
+                return
+            raise
+        try:
+            os.write(fd, _encode_line({"sumatra_log": LOG_FORMAT_VERSION, "id": uuid.uuid4().hex}))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _write_log(self, lines):
+        """
+        Atomically replace the log with a new file, containing a header line
+        followed by the given lines.
+        """
+        tmp_file = "%s.%s.tmp" % (self._log_file, uuid.uuid4().hex)
+        with open(tmp_file, 'wb') as fp:
+            fp.write(_encode_line({"sumatra_log": LOG_FORMAT_VERSION, "id": uuid.uuid4().hex}))
+            for line in lines:
+                fp.write(line)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.rename(tmp_file, self._log_file)
+
+    def _append(self, entries):
+        """Append the given entries to the log, in a single write if possible."""
+        content = b"".join(_encode_line(data) for data in entries)
+        fd = os.open(self._log_file, os.O_WRONLY | os.O_APPEND)
+        try:
+            while content:
+                n = os.write(fd, content)
+                content = content[n:]
+        finally:
+            os.close(fd)
+
+    def _load_index(self):
+        """
+        Build the in-memory index, from the sidecar file if it matches the
+        current log, followed by replaying any log entries written after it.
+        """
+        with open(self._log_file, 'rb') as fp:
+            header = fp.readline()
+            for i in range(HEADER_RETRIES):
+                if header.endswith(b"\n"):
+                    break
+                # the log has just been created by another process, which
+                # has not yet written the header
+                time.sleep(0.1)
+                fp.seek(0)
+                header = fp.readline()
+            header = json.loads(header.decode("utf-8"))
+            self._log_id = header["id"]
+            stats = os.fstat(fp.fileno())
+            self._log_inode = stats.st_ino
+            self._index = {}
+            self._position = fp.tell()
+            try:
+                with open(self._index_file) as index_fp:
+                    saved = json.load(index_fp)
+            except (IOError, ValueError):
+                saved = None
+            if (saved and saved.get("format") == INDEX_FORMAT_VERSION and
+                    saved["id"] == self._log_id and saved["position"] <= stats.st_size):
+                self._index = dict((project_name, dict((label, tuple(entry)) for label, entry in entries.items()))
+                                   for project_name, entries in saved["index"].items())
+                self._position = saved["position"]
+            n_replayed = self._replay(fp)
+        if n_replayed > INDEX_REFRESH_ENTRIES:
+            self._save_index()
+
+    def _replay(self, fp):
+        """Update the index from the entries following the last known position."""
+        fp.seek(self._position)
+        n = 0
+        for line in iter(fp.readline, b""):
+            if not line.endswith(b"\n"):  # incomplete write by another process
+                break
+            try:
+                self._index_entry(json.loads(line.decode("utf-8")))
+            except (ValueError, KeyError, TypeError) as err:
+                # a line which was torn, e.g. by concurrent appends on NFS,
+                # where O_APPEND is not atomic; skip it rather than making
+                # the whole store unreadable
+                logger.warning("Skipping unreadable entry at byte %d of %s (%s)",
+                               self._position, self._log_file, err)
+            self._position += len(line)
+            n += 1
+        return n
+
+    def _index_entry(self, data):
+        entries = self._index.setdefault(data["project"], {})
+        if data.get("deleted"):
+            entries.pop(data["label"], None)
+        else:
+            fingerprint = data.get("fingerprint") or serialization.data_fingerprint(data["record"])
+            entries[data["record"]["label"]] = (self._position, data["record"]["timestamp"],
+                                                fingerprint)
+
+    def _refresh(self):
+        """Pick up entries written by other processes since the last access."""
+        try:
+            stats = os.stat(self._log_file)
+        except OSError:
+            stats = None
+        if stats is None or stats.st_ino != self._log_inode:  # compacted or removed
+            if stats is None:
+                self._create_log()
+            self._load_index()
+        elif stats.st_size > self._position:
+            with open(self._log_file, 'rb') as fp:
+                self._replay(fp)
+
+    def _save_index(self):
+        tmp_file = "%s.%s.tmp" % (self._index_file, uuid.uuid4().hex)
+        with open(tmp_file, 'w') as fp:
+            json.dump({"format": INDEX_FORMAT_VERSION, "id": self._log_id,
+                       "position": self._position, "index": self._index}, fp)
+        os.rename(tmp_file, self._index_file)
+
+    def _read(self, offsets):
+        """Return the record data stored at the given positions in the log."""
+        data = []
+        with open(self._log_file, 'rb') as fp:
+            for offset in offsets:
+                fp.seek(offset)
+                data.append(json.loads(fp.readline().decode("utf-8"))["record"])
+        return data
+
+    def _entries(self, project_name):
+        """
+        Return (label, (offset, timestamp, fingerprint)) pairs in the order
+        they were saved.
+        """
+        self._refresh()
+        return sorted(self._index.get(project_name, {}).items(), key=lambda item: item[1][0])
+
+    def list_projects(self):
+        self._refresh()
+        return [project_name for project_name, entries in self._index.items() if entries]
+
+    def has_project(self, project_name):
+        self._refresh()
+        return bool(self._index.get(project_name))
+
+    def save(self, project_name, record):
+        self.save_many(project_name, [record])
+
+    def save_many(self, project_name, records):
+        entries = []
+        for record in records:
+            data = record2dict(record)
+            entries.append({"project": project_name, "record": data,
+                            "fingerprint": serialization.data_fingerprint(data)})
+        self._append(entries)
+
+    def get(self, project_name, label):
+        return self.get_many(project_name, [label])[0]
+
+    def get_many(self, project_name, labels):
+        self._refresh()
+        entries = self._index.get(project_name, {})
+        offsets = [entries[label][0] for label in labels]
+        decoder = serialization.RecordDecoder()
+        return [decoder.build_record(data) for data in self._read(offsets)]
+
+    def list(self, project_name, tags=None):
+        offsets = [entry[0] for label, entry in self._entries(project_name)]
+        decoder = serialization.RecordDecoder()
+        records = [decoder.build_record(data) for data in self._read(offsets)]
+        if tags:
+            if not isinstance(tags, list):
+                tags = [tags]
+            records = [record for record in records
+                       if any(tag in record.tags for tag in tags)]
+        return records
+
+    def labels(self, project_name):
+        return [label for label, entry in self._entries(project_name)]
+
+    def fingerprints(self, project_name):
+        return dict((label, entry[2]) for label, entry in self._entries(project_name))
+
+    def delete(self, project_name, label):
+        self.delete_many(project_name, [label])
+
+    def delete_many(self, project_name, labels):
+        labels = list(labels)
+        self._refresh()
+        entries = self._index.get(project_name, {})
+        for label in labels:
+            if label not in entries:
+                raise KeyError(label)
+        self._append({"project": project_name, "label": label, "deleted": True}
+                     for label in labels)
+
+    def delete_all(self):
+        """Delete all records from the store."""
+        self._write_log([])
+        self._load_index()
+        self._save_index()
+
+    def delete_by_tag(self, project_name, tag):
+        for_deletion = [record.label for record in self.list(project_name, tag)]
+        self.delete_many(project_name, for_deletion)
+        return len(for_deletion)
+
+    def most_recent(self, project_name):
+        entries = self._entries(project_name)
+        if not entries:
+            return None
+        # ties in the (one-second resolution) timestamp go to the last saved
+        return max(entries, key=lambda item: (item[1][1], item[1][0]))[0]
+
+    def compact(self):
+        """
+        Rewrite the log so that it contains only the current version of each
+        record, dropping deleted and overwritten entries.
+
+        This must not be run while other processes are writing to the store.
+        """
+        self._refresh()
+        offsets = sorted(entry[0] for entries in self._index.values()
+                         for entry in entries.values())
+        with open(self._log_file, 'rb') as fp:
+            def live_lines():
+                for offset in offsets:
+                    fp.seek(offset)
+                    yield fp.readline()
+            self._write_log(live_lines())
+        self._load_index()
+        self._save_index()
+
+    def clear(self):
+        for path in (self._log_file, self._index_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @classmethod
+    def accepts_uri(cls, uri):
+        return os.path.splitext(uri)[1] == ".jsonl"
+
+    def backup(self):
+        """
+        Copy the log file
+        """
+        shutil.copy2(self._log_file, self._log_file + ".backup")
+
+    def remove(self):
+        """
+        Delete the log and index files entirely.
+        """
+        self.backup()
+        self.clear()
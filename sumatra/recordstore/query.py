@@ -0,0 +1,237 @@
+"""
+Defines the RecordQuery class, which describes a selection of records from a
+record store, for use with :meth:`RecordStore.query` and
+:meth:`RecordStore.count`.
+
+Record stores translate as much of a query as they can into their native
+query mechanism, and use :meth:`RecordQuery.matches` for the remainder.
+
+
+:copyright: Copyright 2006-2015 by the Sumatra team, see doc/authors.txt
+:license: BSD 2-clause, see LICENSE for details.
+"""
+from __future__ import unicode_literals
+from builtins import object
+
+import json
+from itertools import islice
+from sumatra.recordstore.serialization import datestring_to_datetime
+
+
+FILTERS = ("tags", "since", "until", "min_duration", "max_duration", "user",
+           "main_file", "version", "outcome", "parameters")
+ORDERABLE_FIELDS = ("timestamp", "label", "duration", "user", "main_file", "version")
+QUERY_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _sort_key(value):
+    # records with no value for the field go last in ascending order
+    return (value is None, value if value is not None else 0)
+
+
+def _parameter_value(parameters, name):
+    """Look up a (possibly dotted) parameter name, raising KeyError if absent."""
+    value = parameters.as_dict() if hasattr(parameters, "as_dict") else parameters
+    for part in name.split("."):
+        if not isinstance(value, dict):
+            raise KeyError(name)
+        value = value[part]
+    return value
+
+
+class RecordQuery(object):
+    """
+    A selection of records, specified by any combination of the following
+    criteria (all of which must be satisfied):
+
+      *tags*: a tag or list of tags; records having any of them are selected.
+      *since*, *until*: datetimes bounding the record timestamp. *since* is
+                        inclusive, *until* is exclusive.
+      *min_duration*, *max_duration*: inclusive bounds on the duration, in seconds.
+      *user*, *main_file*, *version*: must equal the corresponding record
+                                      attribute.
+      *outcome*: text which must appear in the record outcome (case-insensitive).
+      *parameters*: a dict mapping parameter names (using dots for nested
+                    parameters, e.g. "input.dt") to the required values.
+
+    The selected records are sorted by *order_by*, which may be any of
+    "timestamp", "label", "duration", "user", "main_file" or "version",
+    prefixed with "-" for descending order (the default is "-timestamp", newest
+    first). The first *offset* records are skipped, and at most *limit*
+    records are returned.
+    """
+
+    def __init__(self, tags=None, since=None, until=None, min_duration=None,
+                 max_duration=None, user=None, main_file=None, version=None,
+                 outcome=None, parameters=None, order_by="-timestamp", limit=None,
+                 offset=0):
+        if tags and not isinstance(tags, list):
+            tags = [tags]
+        self.tags = tags or None
+        self.since = since
+        self.until = until
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.user = user
+        self.main_file = main_file
+        self.version = version
+        self.outcome = outcome or None
+        self.parameters = parameters or None
+        if order_by.lstrip("-") not in ORDERABLE_FIELDS:
+            raise ValueError("Cannot order records by '%s'. Valid fields are: %s" % (
+                             order_by, ", ".join(ORDERABLE_FIELDS)))
+        self.order_by = order_by
+        self.limit = limit
+        self.offset = offset or 0
+
+    def __repr__(self):
+        args = ["%s=%r" % (name, value) for name, value in sorted(self.filters().items())]
+        args.append("order_by=%r" % self.order_by)
+        if self.limit is not None:
+            args.append("limit=%r" % self.limit)
+        if self.offset:
+            args.append("offset=%r" % self.offset)
+        return "RecordQuery(%s)" % ", ".join(args)
+
+    def __eq__(self, other):
+        return (isinstance(other, RecordQuery) and
+                self.filters() == other.filters() and
+                (self.order_by, self.limit, self.offset) == (other.order_by, other.limit, other.offset))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    @property
+    def order_field(self):
+        return self.order_by.lstrip("-")
+
+    @property
+    def descending(self):
+        return self.order_by.startswith("-")
+
+    @property
+    def paginated(self):
+        return bool(self.offset) or self.limit is not None
+
+    def filters(self):
+        """Return a dict containing the criteria which have been set."""
+        return dict((name, getattr(self, name)) for name in FILTERS
+                    if getattr(self, name) is not None)
+
+    def without(self, *names):
+        """
+        Return a copy of the query with the given criteria removed, and with
+        the default ordering and no pagination.
+
+        Record stores use this to obtain the part of a query that they cannot
+        handle natively.
+        """
+        filters = self.filters()
+        for name in names:
+            filters.pop(name, None)
+        return RecordQuery(**filters)
+
+    def matches_timestamp(self, timestamp):
+        return ((self.since is None or timestamp >= self.since) and
+                (self.until is None or timestamp < self.until))
+
+    def matches(self, record):
+        """Does the given record satisfy all the criteria?"""
+        if self.tags and not any(tag in record.tags for tag in self.tags):
+            return False
+        if not self.matches_timestamp(record.timestamp):
+            return False
+        if self.min_duration is not None or self.max_duration is not None:
+            if record.duration is None:
+                return False
+            if self.min_duration is not None and record.duration < self.min_duration:
+                return False
+            if self.max_duration is not None and record.duration > self.max_duration:
+                return False
+        for name in ("user", "main_file", "version"):
+            value = getattr(self, name)
+            if value is not None and getattr(record, name) != value:
+                return False
+        if self.outcome is not None:
+            if self.outcome.lower() not in (record.outcome or "").lower():
+                return False
+        if self.parameters:
+            for name, value in self.parameters.items():
+                try:
+                    if _parameter_value(record.parameters, name) != value:
+                        return False
+                except KeyError:
+                    return False
+        return True
+
+    def sort(self, records):
+        """Return a new list containing the given records in the requested order."""
+        return sorted(records, key=lambda record: _sort_key(getattr(record, self.order_field)),
+                      reverse=self.descending)
+
+    def paginate(self, records):
+        """Return an iterator over the requested slice of the (ordered) records."""
+        if self.limit is None:
+            return islice(records, self.offset, None)
+        return islice(records, self.offset, self.offset + self.limit)
+
+    def apply(self, records):
+        """
+        Return a list of those of the given records that satisfy the query,
+        in the requested order, and paginated.
+        """
+        return list(self.paginate(self.sort(record for record in records
+                                             if self.matches(record))))
+
+    def to_query_params(self, paginate=True):
+        """
+        Return the query as a list of (name, value) string pairs, suitable for
+        encoding as a URL query string.
+        """
+        params = []
+        for name, value in sorted(self.filters().items()):
+            if name == "tags":
+                params.append((name, ",".join(value)))
+            elif name in ("since", "until"):
+                params.append((name, value.strftime(QUERY_TIMESTAMP_FORMAT)))
+            elif name == "parameters":
+                for param_name, param_value in sorted(value.items()):
+                    params.append(("parameters.%s" % param_name, json.dumps(param_value)))
+            else:
+                params.append((name, "%s" % value))
+        params.append(("order_by", self.order_by))
+        if paginate:
+            if self.limit is not None:
+                params.append(("limit", "%d" % self.limit))
+            if self.offset:
+                params.append(("offset", "%d" % self.offset))
+        return params
+
+    @classmethod
+    def from_query_params(cls, params):
+        """
+        Create a query from a dict or list of (name, value) string pairs, as
+        produced by :meth:`to_query_params`.
+        """
+        if hasattr(params, "items"):
+            params = params.items()
+        kwargs = {}
+        parameters = {}
+        for name, value in params:
+            if name == "tags":
+                kwargs[name] = value.split(",")
+            elif name in ("since", "until"):
+                kwargs[name] = datestring_to_datetime(value)
+            elif name in ("min_duration", "max_duration"):
+                kwargs[name] = float(value)
+            elif name in ("limit", "offset"):
+                kwargs[name] = int(value)
+            elif name.startswith("parameters."):
+                parameters[name[len("parameters."):]] = json.loads(value)
+            elif name in FILTERS or name == "order_by":
+                kwargs[name] = value
+            else:
+                raise ValueError("Unknown query parameter '%s'" % name)
+        if parameters:
+            kwargs["parameters"] = parameters
+        return cls(**kwargs)
@@ -7,8 +7,13 @@ Handles serialization/deserialization of record store contents to/from JSON.
 """
 from __future__ import unicode_literals
 from builtins import str
+from builtins import object
 
+import io
+import copy
 import json
+import gzip
+import hashlib
 from datetime import datetime
 from sumatra import programs, launch, datastore, versioncontrol, parameters, dependency_finder
 from sumatra.records import Record
@@ -20,6 +25,75 @@ def encode_record(record, indent=None):
     return record2json(record, indent)
 
 
+def encode_records(records, indent=None):
+    """Encode a list of Sumatra records as a JSON array."""
+    return "[" + ", ".join(record2json(record, indent) for record in records) + "]"
+
+
+def iter_encode_records(records, format="json", indent=2):
+    """
+    Return an iterator over successive pieces of the JSON encoding of the
+    given records, either as a JSON array (*format* "json") or with one
+    record per line (*format* "jsonl").
+    """
+    if format == "jsonl":
+        for record in records:
+            yield record2json(record) + "\n"
+    elif format == "json":
+        yield "["
+        for i, record in enumerate(records):
+            if i > 0:
+                yield ",\n"
+            yield record2json(record, indent=indent)
+        yield "]"
+    else:
+        raise ValueError("Unknown export format '%s'. Use 'json' or 'jsonl'." % format)
+
+
+def open_export_file(path, mode="r"):
+    """
+    Open a file of exported records as text, compressed with gzip if the file
+    name ends with ".gz".
+    """
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, mode + "b"), encoding="utf-8")
+    return io.open(path, mode, encoding="utf-8")
+
+
+def _canonical(value):
+    """
+    Normalize nested record data so that equivalent records give the same
+    fingerprint whichever record store they have passed through: lists of
+    data keys, dependencies etc. are sorted, and None is equivalent to an
+    empty string.
+    """
+    if isinstance(value, dict):
+        return dict((k, _canonical(v)) for k, v in value.items())
+    elif isinstance(value, list):
+        return sorted((_canonical(item) for item in value),
+                      key=lambda item: json.dumps(item, sort_keys=True))
+    elif value is None:
+        return ""
+    return value
+
+
+def data_fingerprint(data):
+    """
+    Return a fingerprint of the content of a record, given as nested
+    dicts (see :func:`sumatra.formatting.record2dict`).
+    """
+    canonical = json.dumps(_canonical(data), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def record_fingerprint(record):
+    """
+    Return a fingerprint of the content of a Sumatra record. Two records
+    with the same fingerprint can be considered identical.
+    """
+    return data_fingerprint(record2dict(record))
+
+
 def encode_project_info(long_name, description):
     """Encode a Sumatra project as JSON"""
     data = {}
@@ -56,6 +130,13 @@ def datestring_to_datetime(s):
     """docstring"""
     if s is None:
         return s
+    # fast path for the format written by record2dict()
+    if len(s) == 19 and s[4] == s[7] == "-" and s[10] in " T" and s[13] == s[16] == ":":
+        try:
+            return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                            int(s[11:13]), int(s[14:16]), int(s[17:19]))
+        except ValueError:
+            pass
     try:
         timestamp = datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
     except ValueError:
@@ -63,92 +144,172 @@ def datestring_to_datetime(s):
     return timestamp
 
 
-def build_record(data):
-    """Create a Sumatra record from a nested dictionary."""
-    edata = data["executable"]
-    cls = get_registered_components(programs.Executable).get(edata["name"], programs.Executable)
-    executable = cls(edata["path"], edata["version"], edata.get("options", ""))
-    executable.name = edata["name"]
-    rdata = data["repository"]
-    repos_cls = None
-    for m in versioncontrol.vcs_list:
-        if hasattr(m, rdata["type"]):
-            repos_cls = getattr(m, rdata["type"])
-            break
-    if repos_cls is None:
-        repos_cls = versioncontrol.base.Repository
-    repository = repos_cls(rdata["url"])
-    repository.upstream = rdata.get("upstream", None)
-    pdata = data["parameters"]
-    if pdata["type"] == "dict":
-        parameter_set = eval(pdata["content"])
-        assert isinstance(parameter_set, dict)
-    else:
-        parameter_set = getattr(parameters, pdata["type"])(pdata["content"])
-    ldata = data["launch_mode"]
-    lm_parameters = ldata["parameters"]
-    if isinstance(lm_parameters, str):  # prior to 0.3
-        lm_parameters = eval(lm_parameters)
-    launch_mode = getattr(launch, ldata["type"])(**keys2str(lm_parameters))
-
-    def build_data_store(ddata):
+def _freeze(value):
+    """Return a hashable equivalent of a nested structure of JSON data."""
+    if isinstance(value, dict):
+        try:
+            return frozenset(value.items())
+        except TypeError:  # nested dicts or lists
+            return frozenset((k, _freeze(v)) for k, v in value.items())
+    elif isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class RecordDecoder(object):
+    """
+    Creates Sumatra records from nested dictionaries.
+
+    A decoder remembers the classes it has looked up, and, if *share* is
+    True, the executables, repositories, launch modes, data stores, platforms
+    and dependencies it has created, so that records with identical
+    sub-objects (as most records in a project have) share them rather than
+    each creating their own. A decoder should therefore be used for a single
+    batch of records, e.g. the records read in one query.
+    """
+    max_shared = 10000  # maximum number of sub-objects remembered
+
+    def __init__(self, share=True):
+        self.share = share
+        self._classes = {}
+        self._repository_classes = {}
+        self._shared = {}
+
+    def _class(self, module, name):
+        key = (module.__name__, name)
+        try:
+            return self._classes[key]
+        except KeyError:
+            cls = self._classes[key] = getattr(module, name)
+            return cls
+
+    def _shared_object(self, kind, data, factory):
+        if not self.share:
+            return factory(data)
+        try:
+            key = (kind, _freeze(data))
+            obj = self._shared.get(key)
+        except TypeError:  # unhashable values
+            return factory(data)
+        if obj is None:
+            if len(self._shared) >= self.max_shared:
+                self._shared.clear()
+            obj = self._shared[key] = factory(data)
+        return obj
+
+    def _executable(self, edata):
+        key = ("executable", edata["name"])
+        cls = self._classes.get(key)
+        if cls is None:
+            cls = self._classes[key] = get_registered_components(programs.Executable).get(
+                edata["name"], programs.Executable)
+        executable = cls(edata["path"], edata["version"], edata.get("options", ""))
+        executable.name = edata["name"]
+        return executable
+
+    def _repository(self, rdata):
+        repos_cls = self._repository_classes.get(rdata["type"])
+        if repos_cls is None:
+            for m in versioncontrol.vcs_list:
+                if hasattr(m, rdata["type"]):
+                    repos_cls = self._repository_classes[rdata["type"]] = getattr(m, rdata["type"])
+                    break
+            else:  # not remembered, as a module providing it may be added to vcs_list later
+                repos_cls = versioncontrol.base.Repository
+        repository = repos_cls(rdata["url"])
+        repository.upstream = rdata.get("upstream", None)
+        return repository
+
+    def _launch_mode(self, ldata):
+        lm_parameters = ldata["parameters"]
+        if isinstance(lm_parameters, str):  # prior to 0.3
+            lm_parameters = eval(lm_parameters)
+        return self._class(launch, ldata["type"])(**keys2str(lm_parameters))
+
+    def _data_store(self, ddata):
         ds_parameters = ddata["parameters"]
         if isinstance(ds_parameters, str):  # prior to 0.3
             ds_parameters = eval(ds_parameters)
-        return getattr(datastore, ddata["type"])(**keys2str(ds_parameters))
-    data_store = build_data_store(data["datastore"])
-    if "input_datastore" in data:  # 0.4 onwards
-        input_datastore = build_data_store(data["input_datastore"])
-    else:
-        input_datastore = datastore.FileSystemDataStore("/")
-    input_data = data.get("input_data", [])
-    if isinstance(input_data, str):  # 0.3
-        input_data = eval(input_data)
-    if input_data:
-        if isinstance(input_data[0], str):  # versions prior to 0.4
-            input_data = [datastore.DataKey(path, digest=datastore.IGNORE_DIGEST, creation=None)
-                          for path in input_data]
-        else:
-            input_data = [datastore.DataKey(keydata["path"], keydata["digest"],
-                                            creation=datestring_to_datetime(keydata.get("creation", None)),
-                                            **keys2str(keydata["metadata"]))
-                          for keydata in input_data]
-    record = Record(executable, repository, data["main_file"],
-                    data["version"], launch_mode, data_store, parameter_set,
-                    input_data, data.get("script_arguments", ""),
-                    data["label"], data["reason"], data["diff"],
-                    data.get("user", ""), input_datastore=input_datastore,
-                    timestamp=datestring_to_datetime(data["timestamp"]))
-    tags = data["tags"]
-    if not hasattr(tags, "__iter__"):
-        tags = (tags,)
-    record.tags = set(tags)
-    record.output_data = []
-    if "output_data" in data:
-        for keydata in data["output_data"]:
-            data_key = datastore.DataKey(keydata["path"], keydata["digest"],
-                                         creation=datestring_to_datetime(keydata.get("creation", None)),
-                                         **keys2str(keydata["metadata"]))
-            record.output_data.append(data_key)
-    elif "data_key" in data:  # (versions prior to 0.4)
-        for path in eval(data["data_key"]):
-            data_key = datastore.DataKey(path, digest=datastore.IGNORE_DIGEST,
-                                         creation=None)
-            record.output_data.append(data_key)
-    record.duration = data["duration"]
-    record.outcome = data["outcome"]
-    record.stdout_stderr = data.get("stdout_stderr", "")
-    record.platforms = [launch.PlatformInformation(**keys2str(pldata)) for pldata in data["platforms"]]
-    record.dependencies = []
-    for depdata in data["dependencies"]:
+        return self._class(datastore, ddata["type"])(**keys2str(ds_parameters))
+
+    def _platform(self, pldata):
+        return launch.PlatformInformation(**keys2str(pldata))
+
+    def _dependency(self, depdata):
         dep_args = [depdata["name"], depdata["path"], depdata["version"],
                     depdata["diff"]]
         if "source" in depdata:  # 0.5 onwards
             dep_args.append(depdata["source"])
-        dep = getattr(dependency_finder, depdata["module"]).Dependency(*dep_args)
-        record.dependencies.append(dep)
-    record.repeats = data.get("repeats", None)
-    return record
+        return self._class(dependency_finder, depdata["module"]).Dependency(*dep_args)
+
+    def _data_key(self, keydata):
+        return datastore.DataKey(keydata["path"], keydata["digest"],
+                                 creation=datestring_to_datetime(keydata.get("creation", None)),
+                                 **keys2str(keydata["metadata"]))
+
+    def build_record(self, data):
+        """Create a Sumatra record from a nested dictionary."""
+        shared = self._shared_object
+        executable = shared("executable", data["executable"], self._executable)
+        repository = shared("repository", data["repository"], self._repository)
+        pdata = data["parameters"]
+        if pdata["type"] == "dict":
+            parameter_set = eval(pdata["content"])
+            assert isinstance(parameter_set, dict)
+        else:
+            parameter_set = self._class(parameters, pdata["type"])(pdata["content"])
+        launch_mode = shared("launch_mode", data["launch_mode"], self._launch_mode)
+        data_store = shared("datastore", data["datastore"], self._data_store)
+        if "input_datastore" in data:  # 0.4 onwards
+            # copied, as Record() copies the datastore but not the input datastore
+            input_datastore = copy.copy(shared("datastore", data["input_datastore"], self._data_store))
+        else:
+            input_datastore = datastore.FileSystemDataStore("/")
+        input_data = data.get("input_data", [])
+        if isinstance(input_data, str):  # 0.3
+            input_data = eval(input_data)
+        if input_data:
+            if isinstance(input_data[0], str):  # versions prior to 0.4
+                input_data = [datastore.DataKey(path, digest=datastore.IGNORE_DIGEST, creation=None)
+                              for path in input_data]
+            else:
+                input_data = [self._data_key(keydata) for keydata in input_data]
+        record = Record(executable, repository, data["main_file"],
+                        data["version"], launch_mode, data_store, parameter_set,
+                        input_data, data.get("script_arguments", ""),
+                        data["label"], data["reason"], data["diff"],
+                        data.get("user", ""), input_datastore=input_datastore,
+                        timestamp=datestring_to_datetime(data["timestamp"]))
+        tags = data["tags"]
+        if not hasattr(tags, "__iter__"):
+            tags = (tags,)
+        record.tags = set(tags)
+        record.output_data = []
+        if "output_data" in data:
+            record.output_data = [self._data_key(keydata) for keydata in data["output_data"]]
+        elif "data_key" in data:  # (versions prior to 0.4)
+            for path in eval(data["data_key"]):
+                data_key = datastore.DataKey(path, digest=datastore.IGNORE_DIGEST,
+                                             creation=None)
+                record.output_data.append(data_key)
+        record.duration = data["duration"]
+        record.outcome = data["outcome"]
+        record.stdout_stderr = data.get("stdout_stderr", "")
+        record.platforms = [shared("platform", pldata, self._platform)
+                            for pldata in data["platforms"]]
+        record.dependencies = [shared("dependency", depdata, self._dependency)
+                               for depdata in data["dependencies"]]
+        record.repeats = data.get("repeats", None)
+        return record
+
+    def decode_record(self, content):
+        """Create a Sumatra record from a JSON string."""
+        return self.build_record(json.loads(content))
+
+
+def build_record(data):
+    """Create a Sumatra record from a nested dictionary."""
+    return RecordDecoder(share=False).build_record(data)
 
 
 def decode_record(content):
@@ -158,4 +319,41 @@ def decode_record(content):
 
 def decode_records(content):
     """Create multiple Sumatra records from a JSON string."""
-    return [build_record(data) for data in json.loads(content)]
+    decoder = RecordDecoder()
+    return [decoder.build_record(data) for data in json.loads(content)]
+
+
+def iter_decode_records(fp, chunk_size=65536):
+    """
+    Return an iterator over the Sumatra records in a file, which may contain
+    either a JSON array of records or one record per line.
+
+    The file is read *chunk_size* characters at a time, and each record is
+    created as soon as it has been read, so the whole file is never held in
+    memory.
+    """
+    decoder = json.JSONDecoder()
+    record_decoder = RecordDecoder()
+    buffer = ""
+    position = 0
+    at_eof = False
+    while True:
+        # skip the array brackets and the separators between records
+        while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+            position += 1
+        if position < len(buffer):
+            try:
+                data, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if at_eof:
+                    raise
+            else:
+                yield record_decoder.build_record(data)
+                position = end
+                continue
+        elif at_eof:
+            return
+        chunk = fp.read(max(chunk_size, len(buffer) - position))  # read more for very long records
+        at_eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
@@ -13,9 +13,22 @@ import shutil
 import shelve
 from datetime import datetime
 from sumatra.recordstore.base import RecordStore
+from sumatra.recordstore import serialization
+from sumatra.recordstore.query import RecordQuery
 from ..core import component
 
 
+# Layout 1 (Sumatra <= 0.7) stored all the records of a project as a single
+# dict under the project name. Layout 2 stores one entry per record, under
+# "<project_name>/<label>", plus a manifest under the project name mapping
+# labels to timestamps. Layout 3 adds the record fingerprint to each manifest
+# entry. The layout key cannot clash with a project name, since project names
+# must start with a letter, digit or underscore.
+LAYOUT_KEY = ".layout"
+LAYOUT_VERSION = 3
+SEPARATOR = "/"
+
+
 def check_name(f):
     """
     Some backends to shelve do not accept unicode variables as keys.
@@ -23,12 +36,17 @@ def check_name(f):
     before calling the wrapped method. See http://bugs.python.org/issue1036490
     """
 
-    def wrapped(self, project_name, *args):
+    def wrapped(self, project_name, *args, **kwargs):
         project_name = project_name.__str__()
-        return f(self, project_name, *args)
+        return f(self, project_name, *args, **kwargs)
     return wrapped
 
 
+def record_key(project_name, label):
+    """Return the shelf key under which a single record is stored."""
+    return ("%s%s%s" % (project_name, SEPARATOR, label)).__str__()
+
+
 @component
 class ShelveRecordStore(RecordStore):
     """
@@ -49,6 +67,8 @@ class ShelveRecordStore(RecordStore):
         initial_dir_contents = set(os.listdir(dir))
         self.shelf = shelve.open(shelf_name)
         self._shelf_files = set(os.listdir(dir)).difference(initial_dir_contents)
+        if self.shelf.get(LAYOUT_KEY) != LAYOUT_VERSION:
+            self._upgrade_layout()
 
     def __del__(self):
         if hasattr(self, "shelf"):
@@ -63,67 +83,150 @@ class ShelveRecordStore(RecordStore):
     def __setstate__(self, state):
         self.__init__(**state)
 
+    def _upgrade_layout(self):
+        """
+        Convert a shelf that stores all of a project's records in a single
+        dict, or that has no fingerprints in its manifests, into the current
+        layout.
+        """
+        for key in list(self.shelf.keys()):
+            if key == LAYOUT_KEY or SEPARATOR in key:
+                continue
+            entries = self.shelf[key]
+            if not isinstance(entries, dict):
+                continue
+            manifest = {}
+            for label, entry in entries.items():
+                if isinstance(entry, tuple):  # already converted
+                    manifest[label] = entry
+                    continue
+                if isinstance(entry, datetime):  # layout 2 manifest
+                    record = self.shelf[record_key(key, label)]
+                else:
+                    record = entry
+                    self.shelf[record_key(key, label)] = record
+                manifest[label] = (record.timestamp, serialization.record_fingerprint(record))
+            self.shelf[key] = manifest
+        self.shelf[LAYOUT_KEY] = LAYOUT_VERSION
+        self.shelf.sync()
+
+    def _manifest(self, project_name):
+        """
+        Return a dict mapping record labels to (timestamp, fingerprint) tuples
+        for the project.
+        """
+        return self.shelf.get(project_name, {})
+
     def list_projects(self):
-        return [str(key) for key in self.shelf.keys()]
+        return [str(key) for key in self.shelf.keys()
+                if key != LAYOUT_KEY and SEPARATOR not in key]
 
     def has_project(self, project_name):
         return project_name in self.shelf
 
-    @check_name
     def save(self, project_name, record):
-        if project_name in self.shelf:
-            records = self.shelf[project_name]
-        else:
-            records = {}
-        records[record.label] = record
-        self.shelf[project_name] = records
+        self.save_many(project_name, [record])
+
+    @check_name
+    def save_many(self, project_name, records):
+        manifest = self._manifest(project_name)
+        manifest_changed = False
+        for record in records:
+            self.shelf[record_key(project_name, record.label)] = record
+            # the manifest only needs rewriting if the record content changed
+            entry = (record.timestamp, serialization.record_fingerprint(record))
+            if manifest.get(record.label) != entry:
+                manifest[record.label] = entry
+                manifest_changed = True
+        if manifest_changed:
+            self.shelf[project_name] = manifest
 
     @check_name
     def get(self, project_name, label):
-        return self.shelf[project_name][label]
+        return self.shelf[record_key(project_name, label)]
 
     @check_name
     def list(self, project_name, tags=None):
-        if project_name in self.shelf:
-            if tags:
-                if not isinstance(tags, list):
-                    tags = [tags]
-                records = [record for record in self.shelf[project_name].values()
-                           if any([tag in record.tags for tag in tags])]
-            else:
-                records = list(self.shelf[project_name].values())
-        else:
-            records = []
+        records = [self.shelf[record_key(project_name, label)]
+                   for label in self._manifest(project_name)]
+        if tags:
+            if not isinstance(tags, list):
+                tags = [tags]
+            records = [record for record in records
+                       if any([tag in record.tags for tag in tags])]
         return records
 
+    def _query_labels(self, project_name, query):
+        """
+        Use the manifest to select the labels of the records within the
+        query's timestamp range, in the requested order if the query is
+        ordered by timestamp.
+        """
+        entries = [(label, timestamp) for label, (timestamp, fingerprint) in self._manifest(project_name).items()
+                   if query.matches_timestamp(timestamp)]
+        if query.order_field == "timestamp":
+            entries.sort(key=lambda entry: entry[1], reverse=query.descending)
+        return [label for label, timestamp in entries]
+
+    @check_name
+    def query(self, project_name, query=None):
+        query = query or RecordQuery()
+        labels = self._query_labels(project_name, query)
+        residual = query.without("since", "until")
+        # records are only unpickled when they may be part of the result
+        records = (self.shelf[record_key(project_name, label)] for label in labels)
+        if residual.filters():
+            records = (record for record in records if residual.matches(record))
+        if query.order_field != "timestamp":
+            records = query.sort(records)
+        return list(query.paginate(records))
+
+    @check_name
+    def count(self, project_name, query=None):
+        query = query or RecordQuery()
+        labels = self._query_labels(project_name, query)
+        residual = query.without("since", "until")
+        if not residual.filters():
+            return len(labels)
+        return sum(1 for label in labels
+                   if residual.matches(self.shelf[record_key(project_name, label)]))
+
     @check_name
     def labels(self, project_name):
-        if project_name in self.shelf:
-            return list(self.shelf[project_name].keys())
-        else:
-            return []
+        return list(self._manifest(project_name).keys())
 
     @check_name
+    def fingerprints(self, project_name):
+        return dict((label, fingerprint)
+                    for label, (timestamp, fingerprint) in self._manifest(project_name).items())
+
     def delete(self, project_name, label):
-        records = self.shelf[project_name]
-        records.pop(label)
-        self.shelf[project_name] = records
+        self.delete_many(project_name, [label])
 
     @check_name
+    def delete_many(self, project_name, labels):
+        manifest = self.shelf[project_name]
+        for label in labels:
+            if label not in manifest:
+                raise KeyError(label)
+        for label in set(labels):
+            del manifest[label]
+            del self.shelf[record_key(project_name, label)]
+        self.shelf[project_name] = manifest
+
     def delete_by_tag(self, project_name, tag):
-        for_deletion = [record for record in self.shelf[project_name].values() if tag in record.tags]
-        for record in for_deletion:
-            self.delete(project_name, record.label)
+        for_deletion = [record.label for record in self.list(project_name, tag)]
+        self.delete_many(project_name, for_deletion)
         return len(for_deletion)
 
     @check_name
     def most_recent(self, project_name):
         most_recent = None
         most_recent_timestamp = datetime.min
-        for record in self.shelf[project_name].values():
-            if record.timestamp > most_recent_timestamp:
-                most_recent_timestamp = record.timestamp
-                most_recent = record.label
+        for label, (timestamp, fingerprint) in self.shelf[project_name].items():
+            if timestamp > most_recent_timestamp:
+                most_recent_timestamp = timestamp
+                most_recent = label
         return most_recent
 
     def clear(self):
@@ -0,0 +1,173 @@
+"""
+Provides a durable local queue ("spool") of records waiting to be saved in a
+record store which could not be reached, e.g. a remote server or database
+while the network is down.
+
+Each record is written, as JSON, to its own file in the spool directory,
+named so that records are saved in the order in which they were spooled.
+A file is only deleted once the record has been saved, and saving a record
+twice just replaces it, so a flush which is interrupted can simply be
+repeated. A record which cannot be saved for any other reason than the
+record store being unreachable is moved to the "failed" subdirectory, so
+that it does not hold up the records after it.
+
+
+:copyright: Copyright 2006-2015 by the Sumatra team, see doc/authors.txt
+:license: BSD 2-clause, see LICENSE for details.
+"""
+from __future__ import unicode_literals
+from builtins import object
+
+import os
+import sys
+import json
+import time
+import uuid
+import errno
+import socket
+import logging
+import tempfile
+from datetime import datetime
+from sumatra.recordstore import serialization
+from sumatra.recordstore.base import RecordStoreUnavailableError
+from sumatra.formatting import record2dict
+
+
+MAX_RETRY_DELAY = 60  # seconds
+LOCK_TIMEOUT = 3600  # a lock older than this, in seconds, is assumed to have been left by a crashed process
+
+logger = logging.getLogger("Sumatra")
+
+
+def transient_errors():
+    """
+    Return the exception classes raised when a record store is temporarily
+    unavailable: failures to connect to, or time-outs from, a server, server
+    errors (5xx) from an HTTP record store, or a database which is locked or
+    cannot be connected to. Other errors, e.g. a local file which cannot be
+    written, are not included. Database and HTTP library errors are only
+    included if the corresponding modules have been imported, so that Django
+    is not imported unless it is used.
+    """
+    errors = [socket.timeout, socket.gaierror, RecordStoreUnavailableError]
+    try:
+        errors.append(ConnectionError)
+    except NameError:  # Python 2, where connection errors are socket.error
+        errors.append(socket.error)
+    if "sqlite3" in sys.modules:
+        errors.append(sys.modules["sqlite3"].OperationalError)
+    if "django.db" in sys.modules:
+        errors.append(sys.modules["django.db"].OperationalError)
+    if "httplib2" in sys.modules:
+        errors.append(sys.modules["httplib2"].ServerNotFoundError)
+    return tuple(errors)
+
+
+class RecordSpool(object):
+    """
+    A queue of records waiting to be saved in a record store, kept in the
+    directory *path*, which is created when the first record is added.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.failed_path = os.path.join(path, "failed")
+
+    def __len__(self):
+        return len(self._entries())
+
+    def _entries(self):
+        try:
+            file_names = os.listdir(self.path)
+        except OSError:
+            return []
+        return sorted(name for name in file_names if name.endswith(".json"))
+
+    def add(self, project_name, record):
+        """Add a record to the end of the queue."""
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        name = "%s-%s.json" % (datetime.now().strftime("%Y%m%d%H%M%S%f"), uuid.uuid4().hex)
+        data = json.dumps({"project": project_name, "record": record2dict(record)})
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "w") as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.rename(tmp_path, os.path.join(self.path, name))
+
+    def records(self):
+        """Return a list of (project name, record) tuples, in the order they were spooled."""
+        return [self._read(name) for name in self._entries()]
+
+    def _read(self, name):
+        with open(os.path.join(self.path, name)) as fp:
+            data = json.load(fp)
+        return data["project"], serialization.build_record(data["record"])
+
+    def _set_aside(self, name, err):
+        """Move a record which cannot be saved out of the queue."""
+        if not os.path.isdir(self.failed_path):
+            os.makedirs(self.failed_path)
+        os.rename(os.path.join(self.path, name), os.path.join(self.failed_path, name))
+        logger.warning("Could not save the spooled record %s (%s: %s). It has been moved to %s.",
+                       name, err.__class__.__name__, err, self.failed_path)
+
+    def _lock(self):
+        lock_path = os.path.join(self.path, "lock")
+        try:
+            if time.time() - os.path.getmtime(lock_path) > LOCK_TIMEOUT:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except OSError as err:
+            if err.errno == errno.EEXIST:
+                return None
+            raise
+        return lock_path
+
+    def flush(self, record_store, timeout=0, delay=1.0):
+        """
+        Save the spooled records in *record_store*, in order, and remove them
+        from the spool. If the record store cannot be reached, try again after
+        *delay* seconds, doubling the delay each time, until *timeout* seconds
+        have passed. Records which cannot be saved because of any other error
+        are moved to the `failed_path` directory. Return the number of
+        records saved.
+
+        If another process is already flushing the spool, return 0 at once.
+        """
+        if not self._entries():
+            return 0
+        lock_path = self._lock()
+        if lock_path is None:
+            return 0
+        n = 0
+        start = time.time()
+        try:
+            for name in self._entries():
+                try:
+                    project_name, record = self._read(name)
+                except Exception as err:  # e.g. a file which was not completely written
+                    self._set_aside(name, err)
+                    continue
+                while True:
+                    try:
+                        record_store.save(project_name, record)
+                    except transient_errors():
+                        if time.time() + delay - start > timeout:
+                            return n
+                        time.sleep(delay)
+                        delay = min(2 * delay, MAX_RETRY_DELAY)
+                    except Exception as err:
+                        self._set_aside(name, err)
+                        break
+                    else:
+                        os.remove(os.path.join(self.path, name))
+                        n += 1
+                        break
+        finally:
+            os.remove(lock_path)
+        return n
@@ -0,0 +1,354 @@
+"""
+Handles storage of simulation/analysis records in an SQLite database, using
+the :mod:`sqlite3` module from the Python standard library.
+
+Each record is stored as a row containing its JSON serialization together
+with the fields most often used for searching, with tags and data keys split
+out into separate, indexed tables.
+
+
+:copyright: Copyright 2006-2015 by the Sumatra team, see doc/authors.txt
+:license: BSD 2-clause, see LICENSE for details.
+"""
+from __future__ import unicode_literals
+
+import os
+import json
+import shutil
+import sqlite3
+from sumatra.recordstore.base import RecordStore
+from sumatra.recordstore.query import RecordQuery
+from sumatra.recordstore import serialization
+from sumatra.formatting import record2dict
+from ..core import component
+
+
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS smt_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS smt_project (
+    id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS smt_record (
+    id INTEGER PRIMARY KEY,
+    project TEXT NOT NULL REFERENCES smt_project (id),
+    label TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    user TEXT,
+    main_file TEXT,
+    version TEXT,
+    duration REAL,
+    content TEXT NOT NULL,
+    fingerprint TEXT,
+    UNIQUE (project, label)
+);
+CREATE INDEX IF NOT EXISTS smt_record_timestamp ON smt_record (project, timestamp);
+CREATE TABLE IF NOT EXISTS smt_tag (
+    record_id INTEGER NOT NULL REFERENCES smt_record (id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (tag, record_id)
+);
+CREATE INDEX IF NOT EXISTS smt_tag_record ON smt_tag (record_id);
+CREATE TABLE IF NOT EXISTS smt_datakey (
+    record_id INTEGER NOT NULL REFERENCES smt_record (id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    path TEXT NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS smt_datakey_record ON smt_datakey (record_id);
+CREATE INDEX IF NOT EXISTS smt_datakey_digest ON smt_datakey (digest);
+"""
+
+TABLES = ("smt_datakey", "smt_tag", "smt_record", "smt_project", "smt_meta")
+
+TIMESTAMP_COLUMN_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# query criteria which can be evaluated in SQL
+SQL_FILTERS = ("tags", "since", "until", "min_duration", "max_duration", "user",
+               "main_file", "version")
+
+
+def uri_to_path(uri):
+    """
+    Convert a URI of the form "sqlite:///path/to/db" or "sqlite:path/to/db"
+    to a filesystem path.
+    """
+    if uri.startswith("sqlite:"):
+        uri = uri[len("sqlite:"):]
+        if uri.startswith("//"):
+            uri = uri[2:]
+    return os.path.abspath(uri)
+
+
+def _has_sumatra_schema(path):
+    """Does the file at the given path contain an SQLiteRecordStore database?"""
+    try:
+        with open(path, 'rb') as fp:
+            if fp.read(16) != b"SQLite format 3\x00":
+                return False
+        connection = sqlite3.connect(path)
+        try:
+            cursor = connection.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name='smt_record'")
+            return cursor.fetchone() is not None
+        finally:
+            connection.close()
+    except (IOError, OSError, sqlite3.Error):
+        return False
+
+
+@component
+class SQLiteRecordStore(RecordStore):
+    """
+    Handles storage of simulation/analysis records in an SQLite database,
+    using only the Python standard library.
+
+    The database uses write-ahead logging, so that computations that finish
+    at the same time do not block each other or any process reading from the
+    store. It does not support the *smtweb* interface, which needs the
+    :class:`DjangoRecordStore`.
+    """
+
+    def __init__(self, db_file='.smt/records.sqlite'):
+        self._db_file = uri_to_path(db_file)
+        dir = os.path.dirname(self._db_file)
+        if not os.path.exists(dir):
+            os.makedirs(dir)
+        self._connection = sqlite3.connect(self._db_file, timeout=60)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        self._create_tables()
+
+    def __del__(self):
+        if hasattr(self, "_connection"):
+            self._connection.close()
+
+    def __str__(self):
+        return "Record store using SQLite (database file=%s)" % self._db_file
+
+    def __getstate__(self):
+        return {'db_file': self._db_file}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _create_tables(self):
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+            self._connection.execute(
+                "INSERT OR IGNORE INTO smt_meta (key, value) VALUES ('schema_version', ?)",
+                (str(SCHEMA_VERSION),))
+        version, = self._connection.execute(
+            "SELECT value FROM smt_meta WHERE key = 'schema_version'").fetchone()
+        if int(version) < SCHEMA_VERSION:
+            self._upgrade_schema(int(version))
+
+    def _upgrade_schema(self, version):
+        with self._connection:
+            if version < 2:  # add record fingerprints
+                self._connection.execute("ALTER TABLE smt_record ADD COLUMN fingerprint TEXT")
+                rows = self._connection.execute("SELECT id, content FROM smt_record").fetchall()
+                self._connection.executemany(
+                    "UPDATE smt_record SET fingerprint = ? WHERE id = ?",
+                    [(serialization.data_fingerprint(json.loads(content)), record_id)
+                     for record_id, content in rows])
+            self._connection.execute(
+                "UPDATE smt_meta SET value = ? WHERE key = 'schema_version'",
+                (str(SCHEMA_VERSION),))
+
+    def _select(self, columns, project_name, tags=None, query=None, paginate=False):
+        """
+        Select the given columns for a project's records, newest first or in
+        the order given by *query*. The parts of the query which correspond to
+        columns are applied in SQL.
+        """
+        query = query or RecordQuery(tags=tags)
+        sql = "SELECT %s FROM smt_record WHERE project = ?" % columns
+        args = [project_name]
+        if query.tags:
+            sql += (" AND id IN (SELECT record_id FROM smt_tag WHERE tag IN (%s))"
+                    % ", ".join("?" * len(query.tags)))
+            args.extend(query.tags)
+        for name, condition in (("since", "timestamp >= ?"), ("until", "timestamp < ?")):
+            value = getattr(query, name)
+            if value is not None:
+                sql += " AND " + condition
+                args.append(value.strftime(TIMESTAMP_COLUMN_FORMAT))
+        for name, condition in (("min_duration", "duration >= ?"), ("max_duration", "duration <= ?"),
+                                ("user", "user = ?"), ("main_file", "main_file = ?"),
+                                ("version", "version = ?")):
+            value = getattr(query, name)
+            if value is not None:
+                sql += " AND " + condition
+                args.append(value)
+        direction = query.descending and "DESC" or "ASC"
+        if query.order_field in ("timestamp", "label"):
+            sql += " ORDER BY %s %s" % (query.order_field, direction)
+        else:  # records with no value go last in ascending order
+            sql += " ORDER BY {0} IS NULL {1}, {0} {1}".format(query.order_field, direction)
+        if paginate and query.paginated:
+            sql += " LIMIT ? OFFSET ?"
+            args.extend([-1 if query.limit is None else query.limit, query.offset])
+        return self._connection.execute(sql, args)
+
+    def list_projects(self):
+        return [row[0] for row in self._connection.execute("SELECT id FROM smt_project ORDER BY id")]
+
+    def has_project(self, project_name):
+        cursor = self._connection.execute("SELECT 1 FROM smt_project WHERE id = ?", (project_name,))
+        return cursor.fetchone() is not None
+
+    def _insert(self, project_name, record):
+        self._connection.execute("DELETE FROM smt_record WHERE project = ? AND label = ?",
+                                 (project_name, record.label))
+        data = record2dict(record)
+        cursor = self._connection.execute(
+            "INSERT INTO smt_record (project, label, timestamp, user, main_file, "
+            "version, duration, content, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (project_name, record.label,
+             record.timestamp.strftime(TIMESTAMP_COLUMN_FORMAT),
+             record.user, record.main_file, record.version, record.duration,
+             json.dumps(data), serialization.data_fingerprint(data)))
+        record_id = cursor.lastrowid
+        self._connection.executemany(
+            "INSERT INTO smt_tag (record_id, tag) VALUES (?, ?)",
+            [(record_id, tag) for tag in record.tags])
+        self._connection.executemany(
+            "INSERT INTO smt_datakey (record_id, role, path, digest) VALUES (?, ?, ?, ?)",
+            [(record_id, 'input', key.path, key.digest) for key in record.input_data] +
+            [(record_id, 'output', key.path, key.digest) for key in record.output_data])
+
+    def save(self, project_name, record):
+        self.save_many(project_name, [record])
+
+    def save_many(self, project_name, records):
+        with self._connection:
+            self._connection.execute("INSERT OR IGNORE INTO smt_project (id) VALUES (?)",
+                                     (project_name,))
+            for record in records:
+                self._insert(project_name, record)
+
+    def get(self, project_name, label):
+        return self.get_many(project_name, [label])[0]
+
+    def get_many(self, project_name, labels):
+        labels = list(labels)
+        contents = {}
+        chunk_size = 900  # SQLite limits the number of variables in a query
+        for i in range(0, len(labels), chunk_size):
+            chunk = labels[i:i + chunk_size]
+            cursor = self._connection.execute(
+                "SELECT label, content FROM smt_record WHERE project = ? AND label IN (%s)"
+                % ", ".join("?" * len(chunk)), [project_name] + chunk)
+            contents.update(cursor)
+        decoder = serialization.RecordDecoder()
+        return [decoder.decode_record(contents[label]) for label in labels]
+
+    def list(self, project_name, tags=None):
+        decoder = serialization.RecordDecoder()
+        return [decoder.decode_record(row[0])
+                for row in self._select("content", project_name, tags)]
+
+    def iter_records(self, project_name, tags=None, batch_size=100):
+        cursor = self._select("content", project_name, tags)
+        decoder = serialization.RecordDecoder()
+        for rows in iter(lambda: cursor.fetchmany(batch_size), []):
+            for row in rows:
+                yield decoder.decode_record(row[0])
+
+    def labels(self, project_name, tags=None):
+        return [row[0] for row in self._select("label", project_name, tags)]
+
+    def fingerprints(self, project_name):
+        return dict(self._connection.execute(
+            "SELECT label, fingerprint FROM smt_record WHERE project = ?", (project_name,)))
+
+    def query(self, project_name, query=None):
+        query = query or RecordQuery()
+        residual = query.without(*SQL_FILTERS)
+        decoder = serialization.RecordDecoder()
+        if not residual.filters():
+            return [decoder.decode_record(row[0])
+                    for row in self._select("content", project_name, query=query, paginate=True)]
+        records = (decoder.decode_record(row[0])
+                   for row in self._select("content", project_name, query=query))
+        return list(query.paginate(record for record in records if residual.matches(record)))
+
+    def count(self, project_name, query=None):
+        query = query or RecordQuery()
+        residual = query.without(*SQL_FILTERS)
+        if not residual.filters():
+            return self._select("COUNT(*)", project_name, query=query.without()).fetchone()[0]
+        decoder = serialization.RecordDecoder()
+        return sum(1 for row in self._select("content", project_name, query=query)
+                   if residual.matches(decoder.decode_record(row[0])))
+
+    def delete(self, project_name, label):
+        self.delete_many(project_name, [label])
+
+    def delete_many(self, project_name, labels):
+        with self._connection:
+            for label in labels:
+                cursor = self._connection.execute(
+                    "DELETE FROM smt_record WHERE project = ? AND label = ?",
+                    (project_name, label))
+                if cursor.rowcount == 0:
+                    raise KeyError(label)  # rolls back the whole transaction
+
+    def delete_all(self):
+        """Delete all records from the store."""
+        with self._connection:
+            for table in TABLES[:-1]:
+                self._connection.execute("DELETE FROM %s" % table)
+
+    def delete_by_tag(self, project_name, tag):
+        with self._connection:
+            cursor = self._connection.execute(
+                "DELETE FROM smt_record WHERE project = ? AND id IN "
+                "(SELECT record_id FROM smt_tag WHERE tag = ?)",
+                (project_name, tag))
+        return cursor.rowcount
+
+    def most_recent(self, project_name):
+        row = self._select("label", project_name).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def clear(self):
+        """
+        Drop all Sumatra-related tables from the database.
+
+        WARNING: this will delete all data. Make sure you have a backup first.
+        """
+        with self._connection:
+            for table in TABLES:
+                self._connection.execute("DROP TABLE IF EXISTS %s" % table)
+        self._create_tables()
+
+    @classmethod
+    def accepts_uri(cls, uri):
+        return uri.startswith("sqlite:") or _has_sumatra_schema(uri)
+
+    def backup(self):
+        """
+        Copy the database file
+        """
+        # move the contents of the write-ahead log into the main file first
+        self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        shutil.copy2(self._db_file, self._db_file + ".backup")
+
+    def remove(self):
+        """
+        Delete the database entirely.
+        """
+        self.backup()
+        self._connection.close()
+        del self._connection
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self._db_file + suffix):
+                os.remove(self._db_file + suffix)
@@ -237,7 +237,7 @@ def image_thumbgrid(request, project):
         limit = int(request.GET.get('limit',8))
         selected_tag = request.GET.get('selected_tag', 'None')
         if selected_tag != 'None':
-            record_all = Record.objects.filter(project_id=project, tags__contains=selected_tag)
+            record_all = Record.objects.filter(project_id=project, tag_names__name=selected_tag)
         else:
             record_all = Record.objects.filter(project_id=project)
 
@@ -452,7 +452,7 @@ def datatable_record(request, project):
 
     # Filter by tag
     if selected_tag != '':
-        records = records.filter(tags__contains=selected_tag)
+        records = records.filter(tag_names__name=selected_tag)
 
     # Filter by search queries
     if search_value != '':
@@ -572,7 +572,7 @@ def datatable_image(request, project):
 
     # Filter by tag
     if selected_tag != '':
-        images = images.filter(output_from_record__tags__contains=selected_tag)
+        images = images.filter(output_from_record__tag_names__name=selected_tag)
 
     # Filter by search queries
     if search_value != '':
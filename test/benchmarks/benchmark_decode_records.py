@@ -0,0 +1,67 @@
+"""
+Measure the time taken to create Sumatra records from their JSON
+representation, as done when reading records from the SQLite, JSON-lines and
+HTTP record stores and when importing an export file.
+
+Usage:
+    python benchmark_decode_records.py [n_records]
+
+n_records (default 100000) records are created that differ in their labels,
+timestamps, parameters and output data, but, as is typical within a project,
+share the same executable, repository, launch mode, data stores, platform and
+dependencies. They are decoded from a JSON array with
+serialization.decode_records(), and the time for parsing the JSON is given
+separately.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+import json
+import time
+from datetime import datetime, timedelta
+from sumatra.records import Record
+from sumatra.recordstore import serialization
+from sumatra.programs import PythonExecutable
+from sumatra.launch import SerialLaunchMode, PlatformInformation
+from sumatra.datastore import FileSystemDataStore, DataKey
+from sumatra.dependency_finder.python import Dependency
+from sumatra.parameters import SimpleParameterSet
+from sumatra.versioncontrol.base import Repository
+
+
+def make_records(n_records):
+    executable = PythonExecutable(sys.executable, version="3.7.16")
+    platform = PlatformInformation(system_name="Linux", ip_addr="10.0.0.1", architecture_bits="64bit",
+                                   machine="x86_64", architecture_linkage="ELF", version="#1 SMP",
+                                   release="6.1.0", network_name="node1", processor="x86_64")
+    dependencies = [Dependency("numpy", "/usr/lib/python3/numpy", "1.16.2", ""),
+                    Dependency("scipy", "/usr/lib/python3/scipy", "1.2.1", "")]
+    start = datetime(2015, 3, 1, 12, 30)
+    for i in range(n_records):
+        timestamp = start + timedelta(seconds=i)
+        record = Record(executable, Repository("/path/to/repository"), "main.py", "99863a9dc5f",
+                        SerialLaunchMode(), FileSystemDataStore("/path/to/Data"),
+                        SimpleParameterSet({"a": i, "dt": 0.1}), [], "", label="record%d" % i,
+                        reason="", diff="", user="benchmark", timestamp=timestamp)
+        record.output_data = [DataKey("output%d.dat" % i, "0123456789abcdef", timestamp, size=1024)]
+        record.platforms = [platform]
+        record.dependencies = dependencies
+        yield record
+
+
+def main(n_records):
+    content = serialization.encode_records(make_records(n_records))
+    start = time.time()
+    json.loads(content)
+    parse_time = time.time() - start
+    start = time.time()
+    records = serialization.decode_records(content)
+    total_time = time.time() - start
+    assert len(records) == n_records
+    print("%d records: %.2f s (parsing JSON %.2f s, creating records %.2f s), %.1f us per record"
+          % (n_records, total_time, parse_time, total_time - parse_time, 1e6 * total_time / n_records))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,51 @@
+"""
+Measure the time taken to calculate the digest of a large data file with
+each of the digest algorithms available for data keys.
+
+Usage:
+    python benchmark_digest_algorithms.py [size_in_MB [n_repeats]]
+
+A file of size_in_MB (default 1000) megabytes of random data is created in
+a temporary directory, and its digest calculated with DataFile.calculate_digest()
+for each algorithm, n_repeats (default 3) times. The best time is given, for
+a warm filesystem cache, so that the speed of hashing rather than of the disk
+is measured (as long as the file fits in memory).
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from sumatra.datastore import FileSystemDataStore
+from sumatra.datastore.filesystem import DataFile
+from sumatra.datastore.base import available_digest_algorithms
+
+MB = 1024 * 1024
+
+
+def main(size, n_repeats):
+    root = tempfile.mkdtemp(prefix="sumatra-benchmark-")
+    try:
+        with open(os.path.join(root, "output.dat"), "wb") as fp:
+            for i in range(size):
+                fp.write(os.urandom(MB))
+        data_file = DataFile("output.dat", FileSystemDataStore(root))
+        data_file.calculate_digest("sha1")  # warm the filesystem cache
+        print("%d MB file" % size)
+        for algorithm in available_digest_algorithms():
+            times = []
+            for i in range(n_repeats):
+                start = time.time()
+                data_file.calculate_digest(algorithm)
+                times.append(time.time() - start)
+            print("%10s: %.2f s (%.0f MB/s)" % (algorithm, min(times), size / min(times)))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 3)
@@ -0,0 +1,63 @@
+"""
+Measure the time taken by FileSystemDataStore.find_new_data() to generate
+keys for the output files of a run which writes many files, hashing
+different numbers of files at once.
+
+Usage:
+    python benchmark_digest_workers.py [n_files [file_size [workers ...]]]
+
+n_files (default 5000) files of file_size bytes (default 100000) of random
+data are created in a temporary directory, and keys are generated for them
+with each of the given numbers of digest workers (default 1, 2, 4, 8). The
+file index is not used, so that every file is hashed. Timings are given for
+a warm filesystem cache. The speed-up is limited by the number of CPU cores.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import shutil
+import datetime
+import tempfile
+from sumatra.datastore import FileSystemDataStore
+
+
+def make_files(root, n_files, file_size):
+    for i in range(n_files):
+        directory = os.path.join(root, "step%03d" % (i // 1000))
+        if not os.path.exists(directory):
+            os.mkdir(directory)
+        with open(os.path.join(directory, "output%04d.dat" % (i % 1000)), "wb") as fp:
+            fp.write(os.urandom(file_size))
+
+
+def main(n_files, file_size, worker_counts):
+    root = tempfile.mkdtemp(prefix="sumatra-benchmark-")
+    try:
+        timestamp = datetime.datetime.now() - datetime.timedelta(seconds=1)
+        make_files(root, n_files, file_size)
+        datastore = FileSystemDataStore(root)
+        print("%d CPU(s), %d files of %d bytes" % (os.cpu_count() if hasattr(os, "cpu_count") else 1,
+                                                   n_files, file_size))
+        datastore.digest_workers = 1
+        datastore.find_new_data(timestamp)  # warm the filesystem cache
+        reference, reference_time = None, None
+        for workers in worker_counts:
+            datastore.digest_workers = workers
+            start = time.time()
+            keys = datastore.find_new_data(timestamp)
+            elapsed = time.time() - start
+            if reference is None:
+                reference, reference_time = keys, elapsed
+            assert keys == reference
+            print("%3d worker(s): %.2f s (%.1f times faster)" % (workers, elapsed, reference_time / elapsed))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 100000,
+         [int(n) for n in sys.argv[3:]] or [1, 2, 4, 8])
@@ -0,0 +1,89 @@
+"""
+Measure the peak memory used in exporting the records of a project to a file,
+and in importing them again, for projects with increasing numbers of records.
+
+Usage:
+    python benchmark_export_memory.py [n_records ...]
+
+Records, each with about 50 kB of captured output, are saved in an SQLite
+record store in a temporary directory. They are exported to a gzipped file
+with RecordStore.export_to_file() and imported into a second store with
+RecordStore.import_from_file(). For comparison, the export is also built as
+a single string, as RecordStore.export() does, and imported from that string.
+Memory is measured with tracemalloc, so this script requires Python 3.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import shutil
+import tempfile
+import tracemalloc
+from datetime import datetime
+from sumatra.records import Record
+from sumatra.recordstore.sqlite_store import SQLiteRecordStore
+from sumatra.recordstore import serialization
+from sumatra.programs import Executable
+from sumatra.launch import SerialLaunchMode
+from sumatra.datastore import FileSystemDataStore
+from sumatra.parameters import SimpleParameterSet
+from sumatra.versioncontrol.base import Repository
+
+PROJECT = "benchmark"
+OUTPUT_SIZE = 50000
+
+
+def make_record(i):
+    record = Record(Executable("/bin/true", version="1"), Repository("/path/to/repository"),
+                    "main.py", "99863a9dc5f", SerialLaunchMode(), FileSystemDataStore("Data"),
+                    SimpleParameterSet({"a": i}), [], "", label="record%d" % i,
+                    reason="", diff="", user="benchmark", timestamp=datetime.now())
+    record.dependencies = []
+    record.platforms = []
+    record.stdout_stderr = ("step %d: ok\n" % i) * (OUTPUT_SIZE // 12)
+    return record
+
+
+def peak_memory(function, *args):
+    """Return the peak memory allocated while calling function(*args), in MB."""
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def import_from_string(store, filename):
+    with serialization.open_export_file(filename) as fp:
+        content = fp.read()
+    records = serialization.decode_records(content)
+    store.save_many(PROJECT, records)
+
+
+def main(sizes):
+    working_dir = tempfile.mkdtemp(prefix="sumatra-benchmark-")
+    try:
+        print("%10s %12s %12s %12s %12s" % ("records", "export (MB)", "old (MB)",
+                                            "import (MB)", "old (MB)"))
+        for n_records in sizes:
+            path = os.path.join(working_dir, str(n_records))
+            os.mkdir(path)
+            store = SQLiteRecordStore(os.path.join(path, "records.sqlite"))
+            store.save_many(PROJECT, [make_record(i) for i in range(n_records)])
+            filename = os.path.join(path, "records.json.gz")
+            export = peak_memory(store.export_to_file, PROJECT, filename)
+            old_export = peak_memory(store.export, PROJECT)
+            target = SQLiteRecordStore(os.path.join(path, "imported.sqlite"))
+            imported = peak_memory(target.import_from_file, PROJECT, filename)
+            target.delete_all()
+            old_import = peak_memory(import_from_string, target, filename)
+            print("%10d %12.1f %12.1f %12.1f %12.1f" % (n_records, export, old_export,
+                                                        imported, old_import))
+    finally:
+        shutil.rmtree(working_dir)
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [100, 400, 1600])
@@ -0,0 +1,93 @@
+"""
+Measure the time taken to find the files created by a run in a large data
+store, with FileSystemDataStore._find_new_data_files() and with the previous
+os.walk()-based implementation, and check that they give the same results.
+
+Usage:
+    python benchmark_find_new_data.py [n_files [n_repeats]]
+
+A synthetic tree of n_files (default 1000000) empty files from "past runs",
+in directories of 1000 files two levels deep, is created in a temporary
+directory, with a few new files among them. Creating the tree takes a few
+minutes for a million files. Timings are given for a warm filesystem cache.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import shutil
+import datetime
+import tempfile
+from sumatra.datastore import FileSystemDataStore
+
+FILES_PER_DIRECTORY = 1000
+DIRECTORIES_PER_LEVEL = 32
+
+
+def walk_find_new_data_files(root, timestamp, ignoredirs=[".smt", ".hg", ".svn", ".git", ".bzr"]):
+    """The implementation of _find_new_data_files() in Sumatra 0.7."""
+    timestamp = timestamp.replace(microsecond=0)
+    length_dataroot = len(root) + len(os.path.sep)
+    new_files = []
+    for dirpath, dirs, files in os.walk(root):
+        for igdir in ignoredirs:
+            if igdir in dirs:
+                dirs.remove(igdir)
+        for file in files:
+            full_path = os.path.join(dirpath, file)
+            relative_path = os.path.join(dirpath[length_dataroot:], file)
+            last_modified = datetime.datetime.fromtimestamp(os.stat(full_path).st_mtime)
+            if last_modified >= timestamp:
+                new_files.append(relative_path)
+    return new_files
+
+
+def make_tree(root, n_files):
+    past = time.time() - 86400
+    for i in range(0, n_files, FILES_PER_DIRECTORY):
+        n = i // FILES_PER_DIRECTORY
+        directory = os.path.join(root, "run%03d" % (n // DIRECTORIES_PER_LEVEL),
+                                 "step%03d" % (n % DIRECTORIES_PER_LEVEL))
+        os.makedirs(directory)
+        for j in range(min(FILES_PER_DIRECTORY, n_files - i)):
+            path = os.path.join(directory, "output%04d.dat" % j)
+            open(path, "w").close()
+            os.utime(path, (past, past))
+    timestamp = datetime.datetime.now()
+    time.sleep(1)
+    new_files = [os.path.join("run000", "step000", "new.dat"), "new.dat"]
+    for path in new_files:
+        open(os.path.join(root, path), "w").close()
+    return timestamp, sorted(new_files)
+
+
+def best_time(function, n_repeats):
+    times = []
+    for i in range(n_repeats):
+        start = time.time()
+        result = function()
+        times.append(time.time() - start)
+    return min(times), result
+
+
+def main(n_files, n_repeats):
+    root = tempfile.mkdtemp(prefix="sumatra-benchmark-")
+    try:
+        start = time.time()
+        timestamp, new_files = make_tree(root, n_files)
+        print("Created %d files in %.0f s" % (n_files, time.time() - start))
+        datastore = FileSystemDataStore(root)
+        walk_time, walk_result = best_time(lambda: walk_find_new_data_files(root, timestamp), n_repeats)
+        scan_time, scan_result = best_time(lambda: datastore._find_new_data_files(timestamp), n_repeats)
+        assert sorted(walk_result) == scan_result == new_files, (walk_result, scan_result)
+        print("os.walk: %.2f s, _find_new_data_files: %.2f s (%.1f times faster)"
+              % (walk_time, scan_time, walk_time / scan_time))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 3)
@@ -0,0 +1,98 @@
+"""
+Measure how the time taken to list the records of a project from an
+HttpRecordStore depends on the number of worker threads, using a local
+stand-in server which only lists record URLs (as older servers do) and which
+waits a fixed time before responding to each request.
+
+Usage:
+    python benchmark_http_fetch.py [n_records] [latency_in_seconds]
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from future import standard_library
+standard_library.install_aliases()
+from builtins import range
+
+import sys
+import json
+import time
+import threading
+from datetime import datetime
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from sumatra.records import Record
+from sumatra.programs import Executable
+from sumatra.launch import SerialLaunchMode
+from sumatra.datastore import FileSystemDataStore
+from sumatra.parameters import SimpleParameterSet
+from sumatra.versioncontrol.base import Repository
+from sumatra.recordstore import serialization
+from sumatra.recordstore.http_store import HttpRecordStore
+
+
+def make_record(label):
+    record = Record(Executable("/bin/true", version="1"), Repository("/path/to/repository"),
+                    "main.py", "99863a9dc5f", SerialLaunchMode(), FileSystemDataStore("/tmp"),
+                    SimpleParameterSet({"a": 1}), [], "", label=label,
+                    reason="", diff="", user="benchmark", timestamp=datetime.now())
+    record.dependencies = []
+    record.platforms = []
+    return record
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(n_records, latency):
+    record_content = serialization.encode_record(make_record("LABEL"))
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            parts = self.path.split("?")[0].strip("/").split("/")
+            if len(parts) == 1:
+                content = json.dumps({
+                    "name": "benchmark", "description": "",
+                    "records": ["http://%s:%d/benchmark/record%d/" % (self.server.server_address + (i,))
+                                for i in range(n_records)]})
+            else:
+                content = record_content.replace("LABEL", parts[1])
+            content = content.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main(n_records, latency):
+    server = ThreadingServer(("127.0.0.1", 0), make_handler(n_records, latency))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = "http://127.0.0.1:%d/" % server.server_address[1]
+    print("%d records, %g s latency" % (n_records, latency))
+    print("%8s %10s %8s" % ("workers", "time (s)", "speed-up"))
+    baseline = None
+    for workers in (1, 2, 4, 8, 16):
+        store = HttpRecordStore(url, workers=workers, cache_dir=False)
+        start = time.time()
+        records = store.list("benchmark")
+        elapsed = time.time() - start
+        assert [r.label for r in records] == ["record%d" % i for i in range(n_records)]
+        baseline = baseline or elapsed
+        print("%8d %10.2f %8.1f" % (workers, elapsed, baseline / elapsed))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+         float(sys.argv[2]) if len(sys.argv) > 2 else 0.02)
@@ -0,0 +1,76 @@
+"""
+Measure the time taken by "smt info" and "smt list" in a project using a
+Django-based record store, from starting the Python interpreter to exiting.
+
+Usage:
+    python benchmark_startup.py [n_repeats]
+
+A scratch project containing a few records is created in a temporary
+directory. The Sumatra package used is the one that is found by Python, so
+to compare two versions of Sumatra, run this script with PYTHONPATH pointing
+to each of them in turn.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import range
+
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import time
+
+SETUP = """
+from datetime import datetime
+from sumatra.projects import Project
+from sumatra.records import Record
+from sumatra.recordstore.django_store import DjangoRecordStore
+from sumatra.programs import Executable
+from sumatra.launch import SerialLaunchMode
+from sumatra.datastore import FileSystemDataStore
+from sumatra.parameters import SimpleParameterSet
+from sumatra.versioncontrol.base import Repository
+
+project = Project("benchmark", record_store=DjangoRecordStore(".smt/records"))
+for i in range(20):
+    record = Record(Executable("/bin/true", version="1"), Repository("/path/to/repository"),
+                    "main.py", "99863a9dc5f", SerialLaunchMode(), FileSystemDataStore("Data"),
+                    SimpleParameterSet({"a": i}), [], "", label="record%d" % i,
+                    reason="", diff="", user="benchmark", timestamp=datetime.now())
+    record.dependencies = []
+    record.platforms = []
+    project.add_record(record)
+"""
+
+
+def time_command(args, n_repeats):
+    times = []
+    for i in range(n_repeats):
+        start = time.time()
+        with open(os.devnull, "w") as devnull:
+            subprocess.check_call(args, stdout=devnull, stderr=devnull)
+        times.append(time.time() - start)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def main(n_repeats):
+    smt = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "bin", "smt"))
+    working_dir = tempfile.mkdtemp(prefix="sumatra-benchmark-")
+    cwd = os.getcwd()
+    os.chdir(working_dir)
+    try:
+        subprocess.check_call([sys.executable, "-c", SETUP])
+        print("%-30s %10s %10s" % ("", "min (s)", "median (s)"))
+        for description, args in (("python -c pass", [sys.executable, "-c", "pass"]),
+                                  ("smt info", [sys.executable, smt, "info"]),
+                                  ("smt list", [sys.executable, smt, "list"])):
+            print("%-30s %10.3f %10.3f" % ((description,) + time_command(args, n_repeats)))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(working_dir)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
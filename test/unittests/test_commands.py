@@ -138,6 +138,10 @@ class MockProject(object):
                                 script_args=script_args)
     def format_records(self, format='text', mode='short', tags=None, reverse=False):
         self.format_args = {"tags": tags, "mode": mode, "format": format, "reverse": reverse}
+        return ""
+    def iter_format_records(self, format='text', mode='short', tags=None, reverse=False):
+        self.format_args = {"tags": tags, "mode": mode, "format": format, "reverse": reverse}
+        return iter([])
     def delete_record(self, label, delete_data=False):
         if "nota" in label:
             raise KeyError  # or just emit a warning?
@@ -145,7 +149,7 @@ class MockProject(object):
             self._records_deleted.append(label)
     def delete_by_tag(self, tag, delete_data=False):
         self._records_deleted.append("records_tagged_with_%s" % tag)
-    def export(self): self.exported = True
+    def export(self, **kwargs): self.exported = True
     def most_recent(self):
         return MockRecord("most_recent")
     def add_comment(self, label, comment, replace=False):
@@ -179,7 +183,7 @@ def mock_mkdir(path, mode=511):  # octal 777 "-rwxrwxrwx"
 
 
 def mock_build_parameters(filename):
-    if filename != "this.is.not.a.parameter.file":
+    if filename != "this.is.not.a.parameter.file" and not filename.endswith(".dat"):
         return MockParameterSet(filename)
     else:
         return None
@@ -459,6 +463,21 @@ class TestParseArguments(unittest.TestCase):
         self.assertEqual(script_args, "this.is.not.a.parameter.file")
         os.remove("this.is.not.a.parameter.file")
 
+    def test_with_several_datafiles_keys_are_generated_together(self):
+        calls = []
+        original = self.input_datastore.generate_keys
+        self.input_datastore.generate_keys = lambda *paths: calls.append(paths) or original(*paths)
+        for name in ("data1.dat", "data2.dat", "data3.dat"):
+            with open(name, 'w') as f:
+                f.write(name)
+        parameter_sets, input_data, script_args = commands.parse_arguments(
+            ["data1.dat", "-v", "data2.dat"], self.input_datastore, stdin="data3.dat")
+        self.assertEqual(calls, [("data1.dat", "data2.dat", "data3.dat")])
+        self.assertEqual([key.path for key in input_data], ["data1.dat", "data2.dat", "data3.dat"])
+        self.assertEqual(script_args, "data1.dat -v data2.dat < data3.dat")
+        for name in ("data1.dat", "data2.dat", "data3.dat"):
+            os.remove(name)
+
     def test_with_arg_that_is_directory(self):
         test_dir = "__pycache__"  # a directory that is likely to exist already, easier than creating one since we have mocked out os.mkdir
         if os.path.exists(test_dir):
@@ -593,7 +612,8 @@ class ListCommandTests(unittest.TestCase):
 
     def test_with_no_args(self):
         commands.list([])
-        # need some assertion about self.prj.format_args
+        self.assertEqual(self.prj.format_args,
+                         {"tags": [], "mode": "short", "format": "text", "reverse": False})
 
 
 class DeleteCommandTests(unittest.TestCase):
@@ -11,10 +11,18 @@ import shutil
 import os
 import datetime
 import hashlib
+import io
+import threading
 from sumatra.datastore import FileSystemDataStore, ArchivingFileSystemDataStore, get_data_store, DataKey
-from sumatra.datastore.base import DataStore
+from sumatra.datastore.base import (DataStore, CHUNK_SIZE, IGNORE_DIGEST, read_chunks, equal_chunks,
+                                    digest_algorithm, format_digest)
 from sumatra.datastore.filesystem import DataFile
+from sumatra.datastore.index import FileIndex
 from sumatra.core import TIMESTAMP_FORMAT
+try:
+    from sumatra.datastore.davfs import DavFsDataStore
+except ImportError:
+    DavFsDataStore = None
 
 
 class TestFileSystemDataStore(unittest.TestCase):
@@ -62,6 +70,49 @@ class TestFileSystemDataStore(unittest.TestCase):
         self.assertEqual(set(self.ds.find_new_data(tomorrow)),
                          set([]))
 
+    def test__find_new_data_files__should_match_os_walk(self):
+        old = datetime.datetime.now() - datetime.timedelta(days=1)
+        old_time = (old - datetime.datetime(1970, 1, 1)).total_seconds() - 86400
+        for path in ("a/b/c", "a/d", ".smt/records", "e"):
+            os.makedirs(os.path.join(self.root_dir, path))
+        for path in ("a/b/c/new", "a/d/new", ".smt/records/new", "e/old", "a/old", "test_dir/old"):
+            with open(os.path.join(self.root_dir, path), "wb") as f:
+                f.write(self.test_data)
+            if path.endswith("old"):
+                os.utime(os.path.join(self.root_dir, path), (old_time, old_time))
+        os.symlink(os.path.join(self.root_dir, "a"), os.path.join(self.root_dir, "link_to_a"))
+        expected = []
+        for root, dirs, files in os.walk(self.root_dir):
+            if ".smt" in dirs:
+                dirs.remove(".smt")
+            for name in files:
+                full_path = os.path.join(root, name)
+                if datetime.datetime.fromtimestamp(os.stat(full_path).st_mtime) >= self.now.replace(microsecond=0):
+                    expected.append(os.path.relpath(full_path, self.root_dir))
+        self.assertEqual(self.ds._find_new_data_files(self.now), sorted(expected))
+        self.assertEqual(sorted(expected), sorted(self.test_files | set(["a/b/c/new", "a/d/new"])))
+
+    def test__generate_keys__should_return_keys_in_order_with_several_workers(self):
+        paths = sorted(self.test_files)
+        self.ds.digest_workers = 1
+        serial_keys = self.ds.generate_keys(*paths)
+        self.ds.digest_workers = 3
+        self.assertEqual(self.ds.generate_keys(*paths), serial_keys)
+        self.assertEqual([key.path for key in serial_keys], paths)
+
+    def test__digest_algorithm__should_tag_digests_and_check_legacy_keys(self):
+        sha1_key = self.ds.generate_keys('test_file1')[0]
+        self.assertEqual(sha1_key.digest, hashlib.sha1(self.test_data).hexdigest())
+        self.ds.digest_algorithm = "sha256"
+        key = self.ds.generate_keys('test_file1')[0]
+        self.assertEqual(key.digest, "sha256:" + hashlib.sha256(self.test_data).hexdigest())
+        self.assertEqual(self.ds.get_data_item(key).path, 'test_file1')
+        self.assertEqual(self.ds.get_data_item(sha1_key).path, 'test_file1')
+        self.assertRaises(KeyError, self.ds.get_data_item,
+                          DataKey('test_file1', "sha256:" + "0" * 64, key.creation))
+        self.assertRaises(KeyError, self.ds.get_data_item,
+                          DataKey('test_file1', "nosuchhash:" + "0" * 64, key.creation))
+
     def test__get_content__should_return_short_file_content(self):
         digest = hashlib.sha1(self.test_data).hexdigest()
         key = DataKey('test_file1', digest, creation=None)
@@ -137,6 +188,12 @@ class TestArchivingFileSystemDataStore(unittest.TestCase):
         self.ds._archive('test', self.test_files, delete_originals=True)
         self.assert_(not os.path.exists(os.path.join(self.root_dir, 'test_file1')))
 
+    def test__get_data_item__should_raise_KeyError_if_digests_do_not_match(self):
+        self.ds.find_new_data(self.now)
+        key = DataKey('%s/test_file1' % self.now.strftime(TIMESTAMP_FORMAT),
+                      hashlib.sha1(b"other data").hexdigest(), creation=self.now)
+        self.assertRaises(KeyError, self.ds.get_data_item, key)
+
     def test__get_content__should_return_short_file_content(self):
         self.ds.find_new_data(self.now)
         digest = hashlib.sha1(self.test_data).hexdigest()
@@ -155,6 +212,117 @@ class TestArchivingFileSystemDataStore(unittest.TestCase):
         self.assertEqual(content, self.test_data[:10])
 
 
+@unittest.skipIf(DavFsDataStore is None, "fs (PyFilesystem) is not installed")
+class TestDavFsDataStore(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = os.path.abspath('zusehgcfscuzhfqizuchgsireugvcsi')
+        # not DavFsDataStore(), which connects to the server
+        self.ds = DavFsDataStore.__new__(DavFsDataStore)
+        ArchivingFileSystemDataStore.__init__(self.ds, self.root_dir)
+
+    def tearDown(self):
+        for path in (self.root_dir, self.ds.archive_store):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def test__generate_keys__should_read_files_one_at_a_time(self):
+        threads = []
+
+        class MockDataItem(object):
+            def __init__(self, path, store):
+                self.path = path
+            def generate_key(self):
+                threads.append(threading.current_thread())
+                return self.path
+
+        self.ds.data_item_class = MockDataItem
+        self.ds.digest_workers = 4
+        paths = ["test_file%d" % i for i in range(8)]
+        self.assertEqual(self.ds.generate_keys(*paths), paths)
+        self.assertEqual(set(threads), set([threading.current_thread()]))
+
+
+class TestFileIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = os.path.abspath('kusehgcfscuzhfqizuchgsireugvcsi')
+        if os.path.exists(self.root_dir):
+            shutil.rmtree(self.root_dir)
+        self.ds = FileSystemDataStore(self.root_dir)
+        os.mkdir(os.path.join(self.root_dir, ".smt"))
+        self.ds.index = FileIndex(os.path.join(self.root_dir, ".smt", "file_index"))
+        self.test_data = b'licgsnireugcsenrigucsic\ncrgqgjch,kgch'
+        self.digest = hashlib.sha1(self.test_data).hexdigest()
+        self.write('test_file1', self.test_data)
+        self.n_calculated = 0
+        original = DataFile.calculate_digest
+
+        def counting_calculate_digest(data_file, algorithm):
+            self.n_calculated += 1
+            return original(data_file, algorithm)
+        DataFile.calculate_digest = counting_calculate_digest
+        self.addCleanup(delattr, DataFile, "calculate_digest")
+
+    def tearDown(self):
+        self.ds.index.close()
+        shutil.rmtree(self.root_dir)
+
+    def write(self, path, content, age=60):
+        full_path = os.path.join(self.root_dir, path)
+        with open(full_path, 'wb') as f:
+            f.write(content)
+        mtime = os.stat(full_path).st_mtime - age
+        os.utime(full_path, (mtime, mtime))
+
+    def test_digest_of_unchanged_file_is_taken_from_index(self):
+        for i in range(3):
+            self.assertEqual(self.ds.generate_keys('test_file1')[0].digest, self.digest)
+        self.assertEqual(self.n_calculated, 1)
+        self.assertEqual(len(self.ds.index), 1)
+
+    def test_changed_file_is_read_again(self):
+        self.ds.generate_keys('test_file1')
+        self.write('test_file1', b'different content')
+        key = self.ds.generate_keys('test_file1')[0]
+        self.assertEqual(key.digest, hashlib.sha1(b'different content').hexdigest())
+        self.assertEqual(self.n_calculated, 2)
+
+    def test_recently_modified_file_is_read_again(self):
+        self.write('test_file1', self.test_data, age=0)
+        self.ds.generate_keys('test_file1')
+        self.ds.generate_keys('test_file1')
+        self.assertEqual(self.n_calculated, 2)
+
+    def test_get_data_item_does_not_trust_index_to_reject_file(self):
+        data_file = DataFile('test_file1', self.ds)
+        self.ds.index.set(data_file.full_path, data_file._stats, "sha1", "f" * 40, 2 * 10**18)
+        key = DataKey('test_file1', self.digest, data_file.creation)
+        self.assertEqual(self.ds.get_data_item(key).path, 'test_file1')
+        self.assertEqual(len(self.ds.index), 0)
+        self.assertRaises(KeyError, self.ds.get_data_item,
+                          DataKey('test_file1', "e" * 40, data_file.creation))
+
+    def test_update_index_adds_all_files(self):
+        os.mkdir(os.path.join(self.root_dir, 'test_dir'))
+        self.write(os.path.join('test_dir', 'test_file2'), b'abc')
+        self.assertEqual(self.ds.update_index(), 2)
+        self.assertEqual(len(self.ds.index), 2)
+        self.n_calculated = 0
+        self.assertEqual(len(self.ds.find_new_data(datetime.datetime(2000, 1, 1))), 2)
+        self.assertEqual(self.n_calculated, 0)
+
+    def test_corrupted_index_is_replaced(self):
+        self.ds.index.close()
+        with open(self.ds.index.path, 'wb') as f:
+            f.write(b'this is not a database' * 100)
+        self.assertEqual(self.ds.generate_keys('test_file1')[0].digest, self.digest)
+        self.assertEqual(len(self.ds.index), 1)
+
+    def test_copy_shares_index(self):
+        self.assertIs(self.ds.copy().index, self.ds.index)
+
+
 class MockDataStore(object):
         root = os.getcwd()
 
@@ -201,6 +369,48 @@ class TestDataFile(unittest.TestCase):
         self.assertNotEqual(self.data_file, other_data_file)
         os.remove("test_file3")
 
+    def test_digest_of_large_file(self):
+        content = os.urandom(CHUNK_SIZE) * 2 + b"abc"
+        with open("test_file4", "wb") as f:
+            f.write(content)
+        self.assertEqual(DataFile("test_file4", MockDataStore()).digest,
+                         hashlib.sha1(content).hexdigest())
+        os.remove("test_file4")
+
+    def test_eq_does_not_read_whole_content(self):
+        other_data = b'x' + self.test_data[1:]
+        with open("test_file5", "wb") as f:
+            f.write(other_data)
+        other_data_file = DataFile("test_file5", MockDataStore())
+        self.data_file.iter_content = lambda: iter([self.test_data[:4], self.test_data[4:]])
+        other_data_file.iter_content = lambda: iter([other_data[:1], None])  # fails if read beyond 1st chunk
+        other_data_file.iter_sorted_content = lambda: iter([b'crgqgjch,kgch\nxicgsnireugcsenrigucsic'])
+        self.assertNotEqual(self.data_file, other_data_file)
+        os.remove("test_file5")
+        os.remove("%s,sorted" % self.test_file)
+
+
+class TestReadChunks(unittest.TestCase):
+
+    def test_read_chunks(self):
+        fp = io.BytesIO(b"abcdefghij")
+        self.assertEqual([bytes(chunk) for chunk in read_chunks(fp, chunk_size=4)],
+                         [b"abcd", b"efgh", b"ij"])
+        fp.seek(0)
+        self.assertEqual([bytes(chunk) for chunk in read_chunks(fp, length=6, chunk_size=4)],
+                         [b"abcd", b"ef"])
+
+    def test_digest_algorithm(self):
+        self.assertEqual(digest_algorithm(IGNORE_DIGEST), "sha1")
+        self.assertEqual(digest_algorithm(format_digest("blake2b", "abc")), "blake2b")
+        self.assertEqual(format_digest("sha1", "abc"), "abc")
+
+    def test_equal_chunks(self):
+        self.assertTrue(equal_chunks([b"abc", b"def"], [b"a", b"bcde", b"f"]))
+        self.assertFalse(equal_chunks([b"abc", b"def"], [b"abc", b"de"]))
+        self.assertFalse(equal_chunks([b"abc"], [b"abd"]))
+        self.assertTrue(equal_chunks([], [b""]))
+
 
 class TestModuleFunctions(unittest.TestCase):
 
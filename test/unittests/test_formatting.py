@@ -133,6 +133,12 @@ class TestTextFormatter(unittest.TestCase):
         self.assertEqual(tf1.format(mode='long'), tf1.long())
         self.assertEqual(tf1.format(mode='table'), tf1.table())
 
+    def test__iter_format__should_give_the_same_output_as_format(self):
+        for mode in ('short', 'long', 'table'):
+            tf1 = TextFormatter(iter(self.record_list))
+            self.assertEqual("".join(tf1.iter_format(mode)),
+                             TextFormatter(self.record_list).format(mode))
+
     def test__format__should_raise_an_Exception_with_invalid_mode(self):
         tf1 = TextFormatter(self.record_list)
         self.assertRaises(AttributeError, tf1.format, "foo")
@@ -9,6 +9,7 @@ import datetime
 import shutil
 import os
 import sys
+import socket
 import tempfile
 import unittest
 from future.utils import with_metaclass
@@ -176,6 +177,9 @@ class MockRecordStore(object):
         return [self.get(project_name, 'foo_label'),
                 self.get(project_name, 'bar_label')]
 
+    def iter_records(self, project_name, tags=None, batch_size=100):
+        return iter(self.list(project_name, tags))
+
     def delete(self, project_name, label):
         self.deleted = label
 
@@ -295,6 +299,16 @@ class TestProject(unittest.TestCase):
         proj.delete_record("foo")
         self.assertEqual(proj.record_store.deleted, "foo")
 
+    def test__add_record__should_spool_the_record_if_the_record_store_is_unreachable(self):
+        class UnreachableRecordStore(MockRecordStore):
+            def save(self, project_name, record):
+                raise socket.timeout("timed out")
+        proj = Project("test_project",
+                       record_store=UnreachableRecordStore())
+        proj.add_record(MockRecord("record1"))
+        self.assertEqual(proj._most_recent, "record1")
+        self.assertEqual(len(proj.spool), 1)
+
     def test__delete_by_tag__calls_delete_by_tag_on_the_record_store(self):
         proj = Project("test_project",
                        record_store=MockRecordStore())
@@ -370,6 +384,19 @@ class TestModuleFunctions(unittest.TestCase):
         proj2 = load_project()
         self.assertEqual(proj1.name, proj2.name)
 
+    def test__load_project__should_give_data_stores_the_project_file_index(self):
+        Project("test_project", record_store=MockRecordStore())
+        proj = load_project()
+        self.assertEqual(proj.data_store.index.path,
+                         os.path.join(proj.path, ".smt", "file_index"))
+        self.assertIs(proj.input_datastore.index, proj.data_store.index)
+
+    def test__load_project__should_set_digest_workers_of_data_stores(self):
+        Project("test_project", record_store=MockRecordStore(), digest_workers=3)
+        proj = load_project()
+        self.assertEqual(proj.digest_workers, 3)
+        self.assertEqual(proj.data_store.digest_workers, 3)
+
     def test__load_project_should_raise_exception_if_no_project_in_current_dir(self):
         self.assertRaises(Exception, load_project)
 